@@ -12,7 +12,7 @@ from config import (
     POSTGRES_PORT, DATABASE_NAME
 )
 from ml_pipeline import get_ml_pipeline
-from city_mapper import get_city_from_coords
+from city_mapper import get_city_from_coords, get_cities_from_coords
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -450,17 +450,20 @@ async def get_analytics_by_city():
         
         tankers = cursor.fetchall()
         
+        # Resolve every tanker's city in one vectorized pass
+        has_location = [
+            bool(tanker.get('current_location_lat') and tanker.get('current_location_lon'))
+            for tanker in tankers
+        ]
+        cities = get_cities_from_coords(
+            [float(tanker['current_location_lat']) if ok else None for tanker, ok in zip(tankers, has_location)],
+            [float(tanker['current_location_lon']) if ok else None for tanker, ok in zip(tankers, has_location)]
+        )
+        
         # Group by city
         city_stats = {}
-        for tanker in tankers:
+        for tanker, city in zip(tankers, cities):
             tanker_dict = dict(tanker)
-            if tanker_dict.get('current_location_lat') and tanker_dict.get('current_location_lon'):
-                city = get_city_from_coords(
-                    float(tanker_dict['current_location_lat']),
-                    float(tanker_dict['current_location_lon'])
-                )
-            else:
-                city = "Unknown Location"
             
             if city not in city_stats:
                 city_stats[city] = {
@@ -19,7 +19,7 @@ from pathlib import Path
 from typing import List, Optional
 from config import (
     POSTGRES_USER, POSTGRES_PASSWORD, POSTGRES_HOST,
-    POSTGRES_PORT, DATABASE_NAME, OPENROUTER_API_KEY, OPENROUTER_URL
+    POSTGRES_PORT, DATABASE_NAME, OPENROUTER_URL, require_openrouter_key
 )
 from data_generator import get_generator
 from ml_pipeline import get_ml_pipeline
@@ -709,7 +709,8 @@ def get_ml_insights(tanker_id):
 def call_openrouter_api(user_question, data_context=None, ml_insights=None, context="full_chat", max_retries=3):
     """Call OpenRouter API to generate natural language response with retry logic"""
     # Check if API key is available
-    if not OPENROUTER_API_KEY or OPENROUTER_API_KEY == "":
+    api_key = require_openrouter_key()
+    if not api_key:
         logger.warning("OPENROUTER_API_KEY not set, using fallback response")
         if data_context:
             return generate_fallback_response(user_question, data_context, context)
@@ -813,7 +814,7 @@ The tanker is currently:
         }
         
         headers = {
-            "Authorization": f"Bearer {OPENROUTER_API_KEY}",
+            "Authorization": f"Bearer {api_key}",
             "Content-Type": "application/json",
             "HTTP-Referer": "https://tanker-chatbot.onrender.com",
             "X-Title": "Tanker Data Management Chatbot"
@@ -15,10 +15,14 @@ from psycopg2 import errors as psycopg2_errors
 import re
 import json
 import logging
+import numpy as np
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
 from collections import Counter
+from functools import lru_cache
 import difflib
+import threading
+from cachetools import TTLCache
 
 # Try to import sklearn for future ML enhancements (optional)
 try:
@@ -28,14 +32,47 @@ try:
 except ImportError:
     SKLEARN_AVAILABLE = False
 
-from config import (
-    POSTGRES_USER, POSTGRES_PASSWORD, POSTGRES_HOST,
-    POSTGRES_PORT, DATABASE_NAME
-)
+from db_pool import ConnectionPool, execute_prepared
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Pool size; checkouts wait up to db_pool.POOL_WAIT_SECONDS for a free connection
+POOL_MAX_CONNECTIONS = 5
+
+# Statements issued on every chat turn. Each pooled connection PREPAREs them
+# once so Postgres skips parse/plan on subsequent EXECUTEs.
+_PREPARED_STATEMENTS = {
+    'chat_insert_history': """
+        INSERT INTO chat_history
+        (user_message, bot_response, context, tanker_id, intent, topic, confidence_score, response_metadata)
+        VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
+        RETURNING chat_id
+    """,
+    'chat_recent_history': """
+        SELECT chat_id, user_message, bot_response, intent, topic, confidence_score, created_at
+        FROM chat_history
+        WHERE created_at > NOW() - INTERVAL '30 days'
+        ORDER BY created_at DESC
+        LIMIT 100
+    """,
+    'chat_select_pattern': """
+        SELECT pattern_id, usage_count, success_rate
+        FROM chat_learning_patterns
+        WHERE question_pattern = $1
+    """,
+    'chat_update_pattern_usage': """
+        UPDATE chat_learning_patterns
+        SET usage_count = $1, last_used_at = CURRENT_TIMESTAMP
+        WHERE pattern_id = $2
+    """,
+    'chat_insert_pattern': """
+        INSERT INTO chat_learning_patterns
+        (question_pattern, intent, topic, usage_count)
+        VALUES ($1, $2, $3, 1)
+    """,
+}
+
 
 class ChatIntelligence:
     """
@@ -62,25 +99,46 @@ class ChatIntelligence:
             'prediction_request': ['predict', 'forecast', 'estimate', 'likely', 'probability', 'future']
         }
         
+        # Fixed intent order so classify_intent can score into a flat array
+        self._intent_order = list(self.intent_keywords)
+        self._intent_index = {name: i for i, name in enumerate(self._intent_order)}
+        
         # Cache for learned patterns (loaded from DB)
         self.learned_patterns = {}
         self.pattern_cache_loaded = False
         
+        # Short-lived caches keyed by normalized question, so repeated
+        # questions skip keyword scoring, pattern matching and the DB scan.
+        # _patterns_version is bumped whenever learned patterns that affect
+        # intent scoring may have changed. TTLCache is not thread-safe, so
+        # every get/set goes through _cache_lock.
+        self._intent_cache = TTLCache(maxsize=2048, ttl=300)
+        self._topic_cache = TTLCache(maxsize=2048, ttl=300)
+        self._similar_cache = TTLCache(maxsize=2048, ttl=300)
+        self._cache_lock = threading.Lock()
+        self._patterns_version = 0
+        
+        # Connection pool (connections are opened lazily on first use)
+        self._pool = ConnectionPool(1, POOL_MAX_CONNECTIONS)
+        
     def get_db_connection(self):
-        """Create and return a database connection"""
+        """
+        Check out a pooled database connection (return it with _release_connection).
+        Waits up to db_pool.POOL_WAIT_SECONDS for a free connection; returns None on timeout.
+        """
         try:
-            conn = psycopg2.connect(
-                dbname=DATABASE_NAME,
-                user=POSTGRES_USER,
-                password=POSTGRES_PASSWORD,
-                host=POSTGRES_HOST,
-                port=POSTGRES_PORT
-            )
-            return conn
+            return self._pool.getconn()
         except Exception as e:
             logger.error(f"Database connection error: {e}")
             return None
     
+    def _release_connection(self, conn):
+        """Return a connection to the pool, discarding it if it was closed"""
+        try:
+            self._pool.putconn(conn)
+        except Exception as e:
+            logger.debug(f"Error releasing connection: {e}")
+    
     def ensure_chat_tables_exist(self):
         """Self-healing: Create chat tables if they don't exist"""
         conn = self.get_db_connection()
@@ -90,15 +148,17 @@ class ChatIntelligence:
         try:
             cursor = conn.cursor()
             
-            # Check if chat_history table exists
+            # Check which chat tables exist in a single round-trip
             cursor.execute("""
-                SELECT EXISTS (
-                    SELECT FROM information_schema.tables 
-                    WHERE table_schema = 'public' 
-                    AND table_name = 'chat_history'
-                )
+                SELECT
+                    COALESCE(bool_or(table_name = 'chat_history'), FALSE),
+                    COALESCE(bool_or(table_name = 'chat_feedback'), FALSE),
+                    COALESCE(bool_or(table_name = 'chat_learning_patterns'), FALSE)
+                FROM information_schema.tables
+                WHERE table_schema = 'public'
+                AND table_name IN ('chat_history', 'chat_feedback', 'chat_learning_patterns')
             """)
-            chat_history_exists = cursor.fetchone()[0]
+            chat_history_exists, chat_feedback_exists, chat_patterns_exists = cursor.fetchone()
             
             if not chat_history_exists:
                 logger.info("Creating chat_history table...")
@@ -124,16 +184,6 @@ class ChatIntelligence:
                 """)
                 logger.info("chat_history table created")
             
-            # Check if chat_feedback table exists
-            cursor.execute("""
-                SELECT EXISTS (
-                    SELECT FROM information_schema.tables 
-                    WHERE table_schema = 'public' 
-                    AND table_name = 'chat_feedback'
-                )
-            """)
-            chat_feedback_exists = cursor.fetchone()[0]
-            
             if not chat_feedback_exists:
                 logger.info("Creating chat_feedback table...")
                 cursor.execute("""
@@ -151,16 +201,6 @@ class ChatIntelligence:
                 """)
                 logger.info("chat_feedback table created")
             
-            # Check if chat_learning_patterns table exists
-            cursor.execute("""
-                SELECT EXISTS (
-                    SELECT FROM information_schema.tables 
-                    WHERE table_schema = 'public' 
-                    AND table_name = 'chat_learning_patterns'
-                )
-            """)
-            chat_patterns_exists = cursor.fetchone()[0]
-            
             if not chat_patterns_exists:
                 logger.info("Creating chat_learning_patterns table...")
                 cursor.execute("""
@@ -184,22 +224,27 @@ class ChatIntelligence:
             
             conn.commit()
             cursor.close()
-            conn.close()
+            self._release_connection(conn)
             return True
             
         except Exception as e:
             logger.warning(f"Error ensuring chat tables exist: {e}")
             if conn:
                 conn.rollback()
-                conn.close()
+                self._release_connection(conn)
             return False
     
-    def normalize_question(self, question: str) -> str:
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def normalize_question(question: str) -> str:
         """
         Normalize a question for pattern matching
         - Lowercase
         - Remove special characters
         - Remove extra spaces
+        
+        Cached: the same message is normalized several times per chat turn
+        and history rows repeat across find_similar_questions calls.
         """
         normalized = question.lower().strip()
         # Remove special characters but keep spaces
@@ -215,14 +260,29 @@ class ChatIntelligence:
         
         Uses rule-based classification initially, can be enhanced with ML
         """
+        cache_key = (self.normalize_question(question), self._patterns_version)
+        with self._cache_lock:
+            result = self._intent_cache.get(cache_key)
+        if result is not None:
+            return result
+        
+        result = self._score_intent(question)
+        with self._cache_lock:
+            self._intent_cache[cache_key] = result
+        return result
+    
+    def _score_intent(self, question: str) -> Tuple[str, float]:
+        """Score the question against intent keywords and learned patterns"""
         question_lower = question.lower()
-        scores = {}
+        scores = np.zeros(len(self._intent_order))
+        scored = []  # Intent indices in the order they were first scored
         
         # Check against intent keywords
-        for intent, keywords in self.intent_keywords.items():
+        for idx, keywords in enumerate(self.intent_keywords.values()):
             score = sum(1 for keyword in keywords if keyword in question_lower)
             if score > 0:
-                scores[intent] = score / len(keywords)  # Normalize by keyword count
+                scores[idx] = score / len(keywords)  # Normalize by keyword count
+                scored.append(idx)
         
         # Check learned patterns
         if not self.pattern_cache_loaded:
@@ -233,18 +293,21 @@ class ChatIntelligence:
         for pattern, pattern_data in self.learned_patterns.items():
             similarity = difflib.SequenceMatcher(None, normalized_q, pattern).ratio()
             if similarity > 0.7:  # 70% similarity threshold
-                pattern_intent = pattern_data.get('intent', 'general_help')
+                idx = self._intent_index.get(pattern_data.get('intent', 'general_help'))
+                if idx is None:
+                    continue  # Intent no longer known to the classifier
                 pattern_score = similarity * pattern_data.get('success_rate', 0.5)
-                if pattern_intent in scores:
-                    scores[pattern_intent] = max(scores[pattern_intent], pattern_score)
+                if idx in scored:
+                    scores[idx] = max(scores[idx], pattern_score)
                 else:
-                    scores[pattern_intent] = pattern_score
+                    scores[idx] = pattern_score
+                    scored.append(idx)
         
-        if scores:
-            # Get intent with highest score
-            best_intent = max(scores.items(), key=lambda x: x[1])
-            confidence = min(best_intent[1] * 2, 1.0)  # Scale to 0-1
-            return best_intent[0], confidence
+        if scored:
+            # Get intent with highest score (the first scored wins ties)
+            idx = max(scored, key=scores.__getitem__)
+            confidence = float(min(scores[idx] * 2, 1.0))  # Scale to 0-1
+            return self._intent_order[idx], confidence
         
         # Default to general_help
         return 'general_help', 0.3
@@ -253,18 +316,28 @@ class ChatIntelligence:
         """
         Classify question topic
         """
-        question_lower = question.lower()
-        
         # If tanker_id is present, likely specific_tanker
         if tanker_id:
             return 'specific_tanker'
         
+        cache_key = self.normalize_question(question)
+        with self._cache_lock:
+            topic = self._topic_cache.get(cache_key)
+        if topic is not None:
+            return topic
+        
+        question_lower = question.lower()
+        topic = 'general'
+        
         # Check topic keywords
-        for topic, keywords in self.topic_keywords.items():
+        for candidate, keywords in self.topic_keywords.items():
             if any(keyword in question_lower for keyword in keywords):
-                return topic
+                topic = candidate
+                break
         
-        return 'general'
+        with self._cache_lock:
+            self._topic_cache[cache_key] = topic
+        return topic
     
     def store_chat_interaction(
         self,
@@ -287,67 +360,70 @@ class ChatIntelligence:
             logger.warning("Chat tables not available - chat learning disabled")
             return None
         
-        conn = self.get_db_connection()
-        if not conn:
-            return None
+        # Classify if not provided
+        if intent is None or confidence is None:
+            intent, confidence = self.classify_intent(user_message)
         
-        try:
-            cursor = conn.cursor()
-            
-            # Classify if not provided
-            if intent is None or confidence is None:
-                intent, confidence = self.classify_intent(user_message)
-            
-            if topic is None:
-                topic = self.classify_topic(user_message, tanker_id)
-            
-            # Prepare metadata
-            metadata_json = json.dumps(response_metadata or {})
-            
-            cursor.execute("""
-                INSERT INTO chat_history 
-                (user_message, bot_response, context, tanker_id, intent, topic, confidence_score, response_metadata)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                RETURNING chat_id
-            """, (
-                user_message,
-                bot_response,
-                context,
-                tanker_id,
-                intent,
-                topic,
-                confidence,
-                metadata_json
-            ))
+        if topic is None:
+            topic = self.classify_topic(user_message, tanker_id)
+        
+        # Prepare metadata
+        metadata_json = json.dumps(response_metadata or {})
+        params = (
+            user_message,
+            bot_response,
+            context,
+            tanker_id,
+            intent,
+            topic,
+            confidence,
+            metadata_json
+        )
+        
+        # At most one retry: a missing table is re-created once, then we give up
+        chat_id = None
+        for attempt in range(2):
+            conn = self.get_db_connection()
+            if not conn:
+                return None
             
+            try:
+                chat_id = self._do_store(conn, params)
+                self._release_connection(conn)
+                break
+            except psycopg2_errors.UndefinedTable as e:
+                conn.rollback()
+                self._release_connection(conn)
+                if attempt > 0:
+                    logger.warning(f"Chat table still missing after self-healing: {e}")
+                    return None
+                # Table missing - try to create and retry once
+                logger.warning(f"Chat table missing: {e}. Attempting to create...")
+                if not self.ensure_chat_tables_exist():
+                    return None
+            except Exception as e:
+                logger.warning(f"Error storing chat interaction (non-critical): {e}")
+                conn.rollback()
+                self._release_connection(conn)
+                return None
+        
+        logger.debug(f"Stored chat interaction: chat_id={chat_id}, intent={intent}, confidence={confidence:.2f}")
+        
+        # Update learned patterns asynchronously (don't block)
+        self._update_learned_patterns_async(user_message, intent, topic)
+        
+        return chat_id
+    
+    def _do_store(self, conn, params: tuple) -> int:
+        """Insert one chat_history row on the given connection and commit; returns chat_id"""
+        cursor = conn.cursor()
+        try:
+            execute_prepared(cursor, _PREPARED_STATEMENTS, 'chat_insert_history', params)
             chat_id = cursor.fetchone()[0]
             conn.commit()
-            cursor.close()
-            conn.close()
-            
-            logger.debug(f"Stored chat interaction: chat_id={chat_id}, intent={intent}, confidence={confidence:.2f}")
-            
-            # Update learned patterns asynchronously (don't block)
-            self._update_learned_patterns_async(user_message, intent, topic)
-            
             return chat_id
-            
-        except psycopg2_errors.UndefinedTable as e:
-            # Table missing - try to create and retry once
-            logger.warning(f"Chat table missing: {e}. Attempting to create...")
-            if conn:
-                conn.rollback()
-                conn.close()
-            if self.ensure_chat_tables_exist():
-                # Retry once after creating tables
-                return self.store_chat_interaction(user_message, bot_response, context, tanker_id, intent, topic, confidence, response_metadata)
-            return None
-        except Exception as e:
-            logger.warning(f"Error storing chat interaction (non-critical): {e}")
-            if conn:
-                conn.rollback()
-                conn.close()
-            return None
+        finally:
+            cursor.close()
     
     def find_similar_questions(self, question: str, limit: int = 5) -> List[Dict]:
         """
@@ -355,6 +431,13 @@ class ChatIntelligence:
         Returns list of similar questions with their responses
         Self-healing: Gracefully handles missing tables
         """
+        normalized_q = self.normalize_question(question)
+        cache_key = (normalized_q, limit)
+        with self._cache_lock:
+            cached = self._similar_cache.get(cache_key)
+        if cached is not None:
+            return list(cached)
+        
         # Ensure tables exist
         if not self.ensure_chat_tables_exist():
             return []  # Return empty if tables unavailable
@@ -365,26 +448,29 @@ class ChatIntelligence:
         
         try:
             cursor = conn.cursor(cursor_factory=extras.RealDictCursor)
-            normalized_q = self.normalize_question(question)
             
             # Get recent chat history
-            cursor.execute("""
-                SELECT chat_id, user_message, bot_response, intent, topic, confidence_score, created_at
-                FROM chat_history
-                WHERE created_at > NOW() - INTERVAL '30 days'
-                ORDER BY created_at DESC
-                LIMIT 100
-            """)
+            execute_prepared(cursor, _PREPARED_STATEMENTS, 'chat_recent_history')
             
             history = cursor.fetchall()
             cursor.close()
-            conn.close()
+            self._release_connection(conn)
             
-            # Calculate similarity scores
-            similar_questions = []
+            # Collapse repeated questions (rows are newest first, so the most
+            # recent occurrence of each normalized question is kept)
+            unique_history = {}
             for record in history:
                 hist_q = self.normalize_question(record['user_message'])
-                similarity = difflib.SequenceMatcher(None, normalized_q, hist_q).ratio()
+                if hist_q not in unique_history:
+                    unique_history[hist_q] = record
+            
+            # Calculate similarity scores
+            similar_questions = []
+            for hist_q, record in unique_history.items():
+                if hist_q == normalized_q:
+                    similarity = 1.0
+                else:
+                    similarity = difflib.SequenceMatcher(None, normalized_q, hist_q).ratio()
                 
                 if similarity > 0.5:  # 50% similarity threshold
                     similar_questions.append({
@@ -398,17 +484,19 @@ class ChatIntelligence:
             
             # Sort by similarity and return top N
             similar_questions.sort(key=lambda x: x['similarity'], reverse=True)
+            with self._cache_lock:
+                self._similar_cache[cache_key] = similar_questions[:limit]
             return similar_questions[:limit]
             
         except psycopg2_errors.UndefinedTable:
             # Table missing - graceful degradation
             if conn:
-                conn.close()
+                self._release_connection(conn)
             return []
         except Exception as e:
             logger.warning(f"Error finding similar questions (non-critical): {e}")
             if conn:
-                conn.close()
+                self._release_connection(conn)
             return []
     
     def get_improved_response_suggestions(self, question: str, intent: str) -> Optional[Dict]:
@@ -474,7 +562,7 @@ class ChatIntelligence:
             
             conn.commit()
             cursor.close()
-            conn.close()
+            self._release_connection(conn)
             
             # Update learned patterns based on feedback
             self._update_pattern_success_rate_async(chat_id, feedback_type, feedback_value)
@@ -485,13 +573,13 @@ class ChatIntelligence:
             # Table missing - graceful degradation
             if conn:
                 conn.rollback()
-                conn.close()
+                self._release_connection(conn)
             return False
         except Exception as e:
             logger.warning(f"Error recording feedback (non-critical): {e}")
             if conn:
                 conn.rollback()
-                conn.close()
+                self._release_connection(conn)
             return False
     
     def _load_learned_patterns(self):
@@ -520,7 +608,7 @@ class ChatIntelligence:
             
             patterns = cursor.fetchall()
             cursor.close()
-            conn.close()
+            self._release_connection(conn)
             
             self.learned_patterns = {}
             for pattern in patterns:
@@ -539,12 +627,12 @@ class ChatIntelligence:
             # Table missing - graceful degradation
             self.pattern_cache_loaded = True
             if conn:
-                conn.close()
+                self._release_connection(conn)
         except Exception as e:
             logger.warning(f"Error loading learned patterns (non-critical): {e}")
             self.pattern_cache_loaded = True
             if conn:
-                conn.close()
+                self._release_connection(conn)
     
     def _update_learned_patterns_async(self, question: str, intent: str, topic: str):
         """
@@ -566,11 +654,7 @@ class ChatIntelligence:
             cursor = conn.cursor()
             
             # Check if pattern exists
-            cursor.execute("""
-                SELECT pattern_id, usage_count, success_rate
-                FROM chat_learning_patterns
-                WHERE question_pattern = %s
-            """, (normalized_q,))
+            execute_prepared(cursor, _PREPARED_STATEMENTS, 'chat_select_pattern', (normalized_q,))
             
             result = cursor.fetchone()
             
@@ -578,22 +662,17 @@ class ChatIntelligence:
                 # Update existing pattern
                 pattern_id, usage_count, success_rate = result
                 new_usage_count = usage_count + 1
-                cursor.execute("""
-                    UPDATE chat_learning_patterns
-                    SET usage_count = %s, last_used_at = CURRENT_TIMESTAMP
-                    WHERE pattern_id = %s
-                """, (new_usage_count, pattern_id))
+                execute_prepared(cursor, _PREPARED_STATEMENTS, 'chat_update_pattern_usage', (new_usage_count, pattern_id))
+                if new_usage_count == 2:
+                    # Pattern now qualifies for _load_learned_patterns
+                    self._patterns_version += 1
             else:
                 # Insert new pattern
-                cursor.execute("""
-                    INSERT INTO chat_learning_patterns
-                    (question_pattern, intent, topic, usage_count)
-                    VALUES (%s, %s, %s, 1)
-                """, (normalized_q, intent, topic))
+                execute_prepared(cursor, _PREPARED_STATEMENTS, 'chat_insert_pattern', (normalized_q, intent, topic))
             
             conn.commit()
             cursor.close()
-            conn.close()
+            self._release_connection(conn)
             
             # Reload cache
             self.pattern_cache_loaded = False
@@ -601,11 +680,11 @@ class ChatIntelligence:
         except psycopg2_errors.UndefinedTable:
             # Table missing - graceful degradation
             if 'conn' in locals() and conn:
-                conn.close()
+                self._release_connection(conn)
         except Exception as e:
             logger.debug(f"Error updating learned patterns (non-critical): {e}")
             if 'conn' in locals() and conn:
-                conn.close()
+                self._release_connection(conn)
     
     def _update_pattern_success_rate_async(self, chat_id: int, feedback_type: str, feedback_value: Optional[int]):
         """
@@ -627,7 +706,7 @@ class ChatIntelligence:
             chat = cursor.fetchone()
             if not chat:
                 cursor.close()
-                conn.close()
+                self._release_connection(conn)
                 return
             
             normalized_q = self.normalize_question(chat['user_message'])
@@ -666,9 +745,10 @@ class ChatIntelligence:
                 """, (new_success_rate, pattern_id))
                 
                 conn.commit()
+                self._patterns_version += 1
             
             cursor.close()
-            conn.close()
+            self._release_connection(conn)
             
             # Reload cache
             self.pattern_cache_loaded = False
@@ -676,11 +756,11 @@ class ChatIntelligence:
         except psycopg2_errors.UndefinedTable:
             # Table missing - graceful degradation
             if 'conn' in locals() and conn:
-                conn.close()
+                self._release_connection(conn)
         except Exception as e:
             logger.debug(f"Error updating pattern success rate (non-critical): {e}")
             if 'conn' in locals() and conn:
-                conn.close()
+                self._release_connection(conn)
     
     def get_followup_suggestions(self, question: str, intent: str, topic: str) -> List[str]:
         """
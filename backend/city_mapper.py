@@ -3,6 +3,33 @@ City Mapping Utility
 Maps latitude/longitude coordinates to Pakistani city names
 """
 import math
+from functools import lru_cache
+
+import numpy as np
+
+# Numba is optional: when installed, the scalar distance kernels are
+# JIT-compiled and release the GIL, so concurrent request threads can run
+# them in parallel; otherwise they run as plain Python / NumPy. Other
+# modules import njit and NUMBA_AVAILABLE from here.
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+    def njit(*args, **kwargs):
+        """No-op stand-in for numba.njit"""
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda func: func
+
+# SimSIMD is optional: when installed, batch lookups compute the
+# point-to-city distance matrix with its SIMD kernels
+try:
+    import simsimd
+    SIMSIMD_AVAILABLE = True
+except ImportError:
+    SIMSIMD_AVAILABLE = False
 
 # Pakistani cities with their coordinates
 PAKISTANI_CITIES = {
@@ -54,6 +81,34 @@ PAKISTANI_CITIES = {
     "Skardu": (35.2972, 75.6333),
 }
 
+# Radius of Earth in kilometers
+EARTH_RADIUS_KM = 6371.0
+DEG_TO_RAD = math.pi / 180.0
+
+# Frozen views of PAKISTANI_CITIES, built once at import. The dict stays
+# the public source of truth; lookups only touch these.
+_NAMES = tuple(PAKISTANI_CITIES)
+_COORDS = tuple(PAKISTANI_CITIES.values())
+
+# Cities as unit vectors (ECEF on the unit sphere), one row per city, for
+# batch lookups. Squared chord distance between unit vectors is monotonic
+# in great-circle distance, so nearest-city ranking needs no trig per city.
+_CITY_LATS_RAD = np.radians([lat for lat, _ in _COORDS])
+_CITY_LONS_RAD = np.radians([lon for _, lon in _COORDS])
+_CITY_XYZ_ROWS = np.ascontiguousarray(np.column_stack((
+    np.cos(_CITY_LATS_RAD) * np.cos(_CITY_LONS_RAD),
+    np.cos(_CITY_LATS_RAD) * np.sin(_CITY_LONS_RAD),
+    np.sin(_CITY_LATS_RAD),
+)))
+del _CITY_LATS_RAD, _CITY_LONS_RAD
+
+# City names indexed like the arrays, plus a trailing "no match" slot
+_NAMES_OR_UNKNOWN = np.array(_NAMES + ("Unknown Location",), dtype=object)
+
+for _array in (_CITY_XYZ_ROWS, _NAMES_OR_UNKNOWN):
+    _array.flags.writeable = False
+del _array
+
 def get_city_from_coords(lat, lon, threshold_km=50):
     """
     Get city name from latitude/longitude coordinates.
@@ -66,51 +121,141 @@ def get_city_from_coords(lat, lon, threshold_km=50):
     Returns:
         City name string or "Unknown Location" if no match found
     """
-    if lat is None or lon is None:
+    if lat is None or lon is None or not (math.isfinite(lat) and math.isfinite(lon)):
         return "Unknown Location"
     
-    min_distance = float('inf')
-    closest_city = "Unknown Location"
+    # Quantize to 1/1000 degree (~100 m) so repeated pings from stationary
+    # tankers are answered from the cache
+    return _lookup_city(round(lat * 1000), round(lon * 1000), threshold_km)
+
+@lru_cache(maxsize=8192)
+def _lookup_city(lat_q, lon_q, threshold_km):
+    """Nearest city for coordinates quantized to 1/1000 degree"""
+    lat = lat_q / 1000
+    lon = lon_q / 1000
+    
+    # Rank by equirectangular (flat-earth) distance: within ~0.5% of
+    # Haversine at country scale and needs no trig per city
+    idx = _nearest_city_index(lat, lon, math.cos(lat * DEG_TO_RAD))
     
-    for city_name, (city_lat, city_lon) in PAKISTANI_CITIES.items():
-        # Calculate distance using Haversine formula
-        distance = haversine_distance(lat, lon, city_lat, city_lon)
-        
-        if distance < min_distance:
-            min_distance = distance
-            closest_city = city_name
+    # Exact great-circle distance for the threshold check
+    city_lat, city_lon = _COORDS[idx]
+    min_distance = _haversine_kernel(lat, lon, city_lat, city_lon)
     
     # Only return city if within threshold
     if min_distance <= threshold_km:
-        return closest_city
+        return _NAMES[idx]
     else:
         return "Unknown Location"
 
+def get_cities_from_coords(lats, lons, threshold_km=50):
+    """
+    Get city names for many coordinates in one vectorized pass.
+    
+    Args:
+        lats: Array-like of latitudes (None/NaN entries give "Unknown Location")
+        lons: Array-like of longitudes, same length as lats
+        threshold_km: Maximum distance in km to match a city (default: 50km)
+    
+    Returns:
+        NumPy object array of city names, one per input point
+    """
+    lat_rad = np.radians(np.asarray(lats, dtype=np.float64))
+    lon_rad = np.radians(np.asarray(lons, dtype=np.float64))
+    cos_lat = np.cos(lat_rad)
+    points = np.column_stack((cos_lat * np.cos(lon_rad),
+                              cos_lat * np.sin(lon_rad),
+                              np.sin(lat_rad)))
+    
+    # (points x cities) squared chord distance matrix
+    if SIMSIMD_AVAILABLE and len(points):
+        d2 = np.asarray(simsimd.cdist(points, _CITY_XYZ_ROWS, metric="sqeuclidean"))
+    else:
+        # |p - c|^2 = 2 - 2 p.c for unit vectors: a single matrix product
+        # instead of per-axis difference temporaries
+        d2 = 2.0 - 2.0 * (points @ _CITY_XYZ_ROWS.T)
+    idx = d2.argmin(axis=1)
+    min_d2 = d2[np.arange(len(idx)), idx]
+    distances = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.maximum(min_d2, 0.0)) / 2)
+    
+    # NaN distances compare False, so missing coordinates fall through
+    within = distances <= threshold_km
+    return _NAMES_OR_UNKNOWN[np.where(within, idx, len(_NAMES))]
+
+def _build_nearest_city_kernel():
+    """
+    Generate the nearest-city scan specialized on the fixed city table:
+    fully unrolled, with every coordinate baked in as a constant, so there
+    is no loop, no array indexing and no float boxing per city.
+    Returns the index (into _NAMES) of the city with the smallest
+    equirectangular distance to (lat, lon).
+    """
+    lines = ["def _nearest_city_index(lat, lon, cos_lat):"]
+    for i, (city_lat, city_lon) in enumerate(_COORDS):
+        lines.append(f"    dx = ({city_lon!r} - lon) * cos_lat")
+        lines.append(f"    dy = {city_lat!r} - lat")
+        if i == 0:
+            lines.append("    best_d2 = dx * dx + dy * dy")
+            lines.append("    best_idx = 0")
+        else:
+            lines.append("    d2 = dx * dx + dy * dy")
+            lines.append("    if d2 < best_d2:")
+            lines.append("        best_d2 = d2")
+            lines.append(f"        best_idx = {i}")
+    lines.append("    return best_idx")
+    
+    namespace = {}
+    exec(compile("\n".join(lines), "<city_mapper:_nearest_city_index>", "exec"), namespace)
+    # Generated source has no file for numba to cache against
+    return njit(fastmath=True, nogil=True)(namespace["_nearest_city_index"])
+
+_nearest_city_index = _build_nearest_city_kernel()
+
 def haversine_distance(lat1, lon1, lat2, lon2):
     """
     Calculate the great circle distance between two points on Earth.
+    Accepts any real numbers (e.g. Decimal columns from psycopg2).
     Returns distance in kilometers.
     """
-    # Radius of Earth in kilometers
-    R = 6371.0
-    
-    # Convert to radians
-    lat1_rad = math.radians(lat1)
-    lon1_rad = math.radians(lon1)
-    lat2_rad = math.radians(lat2)
-    lon2_rad = math.radians(lon2)
+    return _haversine_kernel(float(lat1), float(lon1), float(lat2), float(lon2))
+
+@njit(cache=True, fastmath=True, nogil=True)
+def _haversine_kernel(lat1, lon1, lat2, lon2):
+    """haversine_distance on floats (callable from other numba kernels)"""
+    lat1_rad = lat1 * DEG_TO_RAD
+    lat2_rad = lat2 * DEG_TO_RAD
+    sin_half_dlat = math.sin((lat2_rad - lat1_rad) * 0.5)
+    sin_half_dlon = math.sin((lon2 - lon1) * (DEG_TO_RAD * 0.5))
     
-    # Haversine formula
-    dlat = lat2_rad - lat1_rad
-    dlon = lon2_rad - lon1_rad
+    # Haversine formula, with cos(lat1)*cos(lat2) taken from the
+    # product-to-sum identity (cos(dlat) + cos(lat1 + lat2)) / 2 and
+    # cos(dlat) = 1 - 2*sin^2(dlat/2) reused from above: three trig calls
+    # instead of four
+    h = sin_half_dlat * sin_half_dlat
+    cos_product = (1.0 - 2.0 * h + math.cos(lat1_rad + lat2_rad)) * 0.5
+    a = h + cos_product * sin_half_dlon * sin_half_dlon
     
-    a = math.sin(dlat / 2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlon / 2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    # asin(sqrt(a)) == atan2(sqrt(a), sqrt(1 - a)) for a in [0, 1]
+    return 2.0 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0)))
+
+def haversine_distances(lat1, lon1, lat2, lon2):
+    """
+    Vectorized haversine_distance over NumPy arrays (broadcasting).
+    Returns distances in kilometers; NaN where any coordinate is missing.
+    """
+    lat1_rad = np.asarray(lat1, dtype=np.float64) * DEG_TO_RAD
+    lat2_rad = np.asarray(lat2, dtype=np.float64) * DEG_TO_RAD
+    lon_delta = np.asarray(lon2, dtype=np.float64) - np.asarray(lon1, dtype=np.float64)
+    sin_half_dlat = np.sin((lat2_rad - lat1_rad) * 0.5)
+    sin_half_dlon = np.sin(lon_delta * (DEG_TO_RAD * 0.5))
     
-    distance = R * c
-    return distance
+    # Same product-to-sum form as _haversine_kernel
+    h = sin_half_dlat * sin_half_dlat
+    cos_product = (1.0 - 2.0 * h + np.cos(lat1_rad + lat2_rad)) * 0.5
+    a = h + cos_product * sin_half_dlon * sin_half_dlon
+    return 2.0 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
 
 def get_all_cities():
     """Get list of all Pakistani cities"""
-    return list(PAKISTANI_CITIES.keys())
+    return list(_NAMES)
 
@@ -1,122 +1,138 @@
 """
 Script to remove placeholder "Customer X", "Customer Y", etc. destinations from the database
 """
-import psycopg2
+import threading
+from contextlib import contextmanager
+from psycopg2 import pool as psycopg2_pool
 from config import (
     POSTGRES_USER, POSTGRES_PASSWORD, POSTGRES_HOST,
     POSTGRES_PORT, DATABASE_NAME
 )
+import psycopg2
+from init_db import apply_migrations, SET_NULL_DESTINATION_FKS
 import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Names listed in the INFO summary line; the full list is logged at DEBUG
+LOG_NAMES_LIMIT = 5
+
+# Lazily created pool so repeated runs in one process skip the connect handshake
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_db_pool():
+    """Get (or create) the shared connection pool"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = psycopg2_pool.ThreadedConnectionPool(
+                    1, 4,
+                    dbname=DATABASE_NAME,
+                    user=POSTGRES_USER,
+                    password=POSTGRES_PASSWORD,
+                    host=POSTGRES_HOST,
+                    port=POSTGRES_PORT
+                )
+    return _pool
+
+@contextmanager
+def pooled_connection():
+    """Borrow a connection from the pool, discarding it if it was closed"""
+    db_pool = get_db_pool()
+    conn = db_pool.getconn()
+    try:
+        yield conn
+    finally:
+        db_pool.putconn(conn, close=bool(conn.closed))
+
 def cleanup_customer_destinations():
     """Remove all destinations with names starting with 'Customer'"""
     try:
-        # Connect to the database
-        conn = psycopg2.connect(
-            dbname=DATABASE_NAME,
-            user=POSTGRES_USER,
-            password=POSTGRES_PASSWORD,
-            host=POSTGRES_HOST,
-            port=POSTGRES_PORT
-        )
-        conn.autocommit = False  # Use transactions
-        cursor = conn.cursor()
-        
-        logger.info("Connected to database. Checking for Customer destinations...")
-        
-        # First, check what we're about to delete
-        cursor.execute("""
-            SELECT destination_id, destination_name 
-            FROM destinations 
-            WHERE destination_name LIKE 'Customer%'
-            ORDER BY destination_name
-        """)
-        customer_destinations = cursor.fetchall()
-        
-        if not customer_destinations:
-            logger.info("✅ No 'Customer' destinations found. Nothing to clean up.")
-            cursor.close()
-            conn.close()
-            return True
-        
-        logger.info(f"Found {len(customer_destinations)} Customer destinations to remove:")
-        for dest_id, dest_name in customer_destinations:
-            logger.info(f"  - {dest_name} (ID: {dest_id})")
-        
-        # Update tankers that reference these destinations
-        logger.info("Updating tankers table...")
+        with pooled_connection() as conn, conn.cursor() as cursor:
+            return _remove_customer_destinations(conn, cursor)
+    except Exception as e:
+        logger.error(f"❌ Error cleaning up Customer destinations: {e}")
+        return False
+
+def _remove_customer_destinations(conn, cursor):
+    """Run the cleanup on a borrowed connection, rolling back on failure"""
+    # Make sure the destination FKs are ON DELETE SET NULL (older databases);
+    # the connection goes back to the pool in its original mode either way
+    autocommit = conn.autocommit
+    conn.autocommit = True
+    try:
+        apply_migrations(cursor)
+    except psycopg2.Error as e:
+        logger.warning(f"Error applying schema migrations: {str(e)[:150]}")
+    finally:
+        conn.autocommit = autocommit
+    
+    try:
+        # The DELETE relies on those FKs nulling the references: refuse to
+        # run it if any of them is missing or not yet migrated
         cursor.execute("""
-            UPDATE tankers 
-            SET destination_id = NULL 
-            WHERE destination_id IN (
-                SELECT destination_id 
-                FROM destinations 
-                WHERE destination_name LIKE 'Customer%'
-            )
-        """)
-        tankers_updated = cursor.rowcount
-        logger.info(f"  Updated {tankers_updated} tanker records")
+            SELECT conname
+            FROM pg_constraint
+            WHERE conname = ANY(%s) AND confdeltype = 'n'
+        """, ([name for _, name in SET_NULL_DESTINATION_FKS],))
+        migrated = {row[0] for row in cursor.fetchall()}
+        pending = [name for _, name in SET_NULL_DESTINATION_FKS if name not in migrated]
+        if pending:
+            conn.rollback()
+            logger.error(f"❌ Foreign keys not ON DELETE SET NULL: {', '.join(pending)}. "
+                         "Run init_db.py to migrate the schema, then retry the cleanup.")
+            return False
         
-        # Update tanker_history records
-        logger.info("Updating tanker_history table...")
-        cursor.execute("""
-            UPDATE tanker_history 
-            SET destination_id = NULL 
-            WHERE destination_id IN (
-                SELECT destination_id 
-                FROM destinations 
-                WHERE destination_name LIKE 'Customer%'
-            )
-        """)
-        history_updated = cursor.rowcount
-        logger.info(f"  Updated {history_updated} history records")
+        logger.info("Connected to database. Removing Customer destinations...")
         
-        # Delete the placeholder destinations
-        logger.info("Deleting Customer destinations...")
+        # Tankers and history referencing these rows are set to NULL by the
+        # ON DELETE SET NULL foreign keys
         cursor.execute("""
-            DELETE FROM destinations 
+            DELETE FROM destinations
             WHERE destination_name LIKE 'Customer%'
+            RETURNING destination_name
         """)
-        deleted_count = cursor.rowcount
-        logger.info(f"  Deleted {deleted_count} destination records")
+        removed = sorted(row[0] for row in cursor.fetchall())
         
         # Commit the transaction
         conn.commit()
-        logger.info("✅ Successfully removed all Customer destinations from the database!")
-        
-        # Verify removal
-        cursor.execute("""
-            SELECT COUNT(*) 
-            FROM destinations 
-            WHERE destination_name LIKE 'Customer%'
-        """)
-        remaining = cursor.fetchone()[0]
-        
-        if remaining == 0:
-            logger.info("✅ Verification: No Customer destinations remain in the database.")
-        else:
-            logger.warning(f"⚠️  Warning: {remaining} Customer destinations still exist!")
-        
-        cursor.close()
-        conn.close()
-        return True
-        
-    except Exception as e:
-        logger.error(f"❌ Error cleaning up Customer destinations: {e}")
-        if conn:
+    except Exception:
+        if not conn.closed:
             conn.rollback()
-            conn.close()
-        return False
+        raise
+    
+    if not removed:
+        logger.info("✅ No 'Customer' destinations found. Nothing to clean up.")
+        return True
+    
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"Removed destinations: {', '.join(removed)}")
+    logger.info(f"Removed {len(removed)} Customer destinations "
+                f"(first {min(len(removed), LOG_NAMES_LIMIT)}: {', '.join(removed[:LOG_NAMES_LIMIT])})")
+    logger.info("✅ Successfully removed all Customer destinations from the database!")
+    return True
 
 if __name__ == "__main__":
-    logger.info("Starting cleanup of Customer destinations...")
-    success = cleanup_customer_destinations()
-    if success:
-        logger.info("Cleanup completed successfully!")
-    else:
-        logger.error("Cleanup failed!")
-        exit(1)
+    # Hand log records to a background listener so handler I/O stays off
+    # the cleanup path
+    root_logger = logging.getLogger()
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, *root_logger.handlers)
+    root_logger.handlers = [QueueHandler(log_queue)]
+    listener.start()
+    try:
+        logger.info("Starting cleanup of Customer destinations...")
+        success = cleanup_customer_destinations()
+        if success:
+            logger.info("Cleanup completed successfully!")
+        else:
+            logger.error("Cleanup failed!")
+            exit(1)
+    finally:
+        listener.stop()
 
@@ -47,29 +47,51 @@ else:
     POSTGRES_PORT = os.getenv("POSTGRES_PORT", "5432")
     DATABASE_NAME = os.getenv("DATABASE_NAME", "tankerdb")
 
-# OpenRouter API Configuration
-OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY", "")
-if not OPENROUTER_API_KEY:
-    logger = logging.getLogger(__name__)
-    logger.warning(
-        "OPENROUTER_API_KEY not set. Chatbot will use fallback responses.\n"
-        "To enable AI features, create a .env file in the backend directory with:\n"
-        "OPENROUTER_API_KEY=your_api_key_here\n\n"
-        "Or set it as an environment variable before running the app."
-    )
-OPENROUTER_URL = os.getenv(
-    "OPENROUTER_URL",
-    "https://openrouter.ai/api/v1/chat/completions"
-)
+# Settings read lazily on first access (PEP 562 module __getattr__) and then
+# cached as plain module globals: name -> (env var default, type)
+_LAZY_SETTINGS = {
+    # OpenRouter API Configuration
+    "OPENROUTER_API_KEY": ("", str),
+    "OPENROUTER_URL": ("https://openrouter.ai/api/v1/chat/completions", str),
+    # Data Generator Configuration
+    "DATA_GENERATION_INTERVAL": ("30", int),  # seconds
+    "STATUS_TRANSITION_INTERVAL": ("300", int),  # 5 minutes in seconds
+    # ML Configuration
+    "ML_MODEL_DIR": ("./models", str),
+    "ML_RETRAIN_INTERVAL": ("3600", int),  # 1 hour in seconds
+    "ML_MIN_SAMPLES_FOR_TRAINING": ("50", int),
+}
 
-# Data Generator Configuration
-DATA_GENERATION_INTERVAL = int(os.getenv("DATA_GENERATION_INTERVAL", "30"))  # seconds
-STATUS_TRANSITION_INTERVAL = int(os.getenv("STATUS_TRANSITION_INTERVAL", "300"))  # 5 minutes in seconds
+def __getattr__(name):
+    try:
+        default, cast = _LAZY_SETTINGS[name]
+    except KeyError:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
+    value = cast(os.getenv(name, default))
+    globals()[name] = value
+    return value
+
+_openrouter_key_warned = False
 
-# ML Configuration
-ML_MODEL_DIR = os.getenv("ML_MODEL_DIR", "./models")
-ML_RETRAIN_INTERVAL = int(os.getenv("ML_RETRAIN_INTERVAL", "3600"))  # 1 hour in seconds
-ML_MIN_SAMPLES_FOR_TRAINING = int(os.getenv("ML_MIN_SAMPLES_FOR_TRAINING", "50"))
+def require_openrouter_key():
+    """
+    Return the OpenRouter API key for code paths that call the API.
+    Logs a warning (once) and returns "" when the key is not configured.
+    """
+    global _openrouter_key_warned
+    api_key = globals().get("OPENROUTER_API_KEY")
+    if api_key is None:
+        api_key = __getattr__("OPENROUTER_API_KEY")
+    if not api_key and not _openrouter_key_warned:
+        _openrouter_key_warned = True
+        logger = logging.getLogger(__name__)
+        logger.warning(
+            "OPENROUTER_API_KEY not set. Chatbot will use fallback responses.\n"
+            "To enable AI features, create a .env file in the backend directory with:\n"
+            "OPENROUTER_API_KEY=your_api_key_here\n\n"
+            "Or set it as an environment variable before running the app."
+        )
+    return api_key
 
 # Application Configuration (for Render deployment)
 # PORT is set by Render automatically
@@ -1,21 +1,325 @@
 """
 Background Data Generator Service
 Generates realistic tanker data every 30 seconds and manages status transitions
+
+The generator is not asyncio-based: each loop runs in a daemon thread on
+pooled psycopg2 connections, and waits on a threading.Event between
+cycles so stop() takes effect immediately instead of after a sleep.
 """
+import csv
+import io
+import numpy as np
 import psycopg2
+from psycopg2.extras import RealDictCursor, execute_values
 import random
-import time
 import threading
+from contextlib import contextmanager
+from types import MappingProxyType
 from datetime import datetime, timedelta
-from config import (
-    POSTGRES_USER, POSTGRES_PASSWORD, POSTGRES_HOST, 
-    POSTGRES_PORT, DATABASE_NAME, STATUS_TRANSITION_INTERVAL
-)
+from config import DATA_GENERATION_INTERVAL, STATUS_TRANSITION_INTERVAL
+from db_pool import ConnectionPool, execute_prepared
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Generator writes are synthetic: losing the last few on a crash is fine, so
+# their transactions don't wait for the WAL flush at commit. SET LOCAL keeps
+# the setting from leaking onto the pooled connection.
+ASYNC_COMMIT_SQL = "SET LOCAL synchronous_commit = OFF"
+
+# Tanker upsert; status_changed_at only moves when the status actually changed
+TANKER_COLUMNS = """
+    tanker_id, driver_id, current_status,
+    current_location_lat, current_location_lon,
+    source_depot_id, destination_id,
+    seal_status, oil_volume_liters, max_capacity_liters,
+    trip_duration_hours, avg_speed_kmh,
+    last_update, status_changed_at
+"""
+TANKER_ON_CONFLICT_SQL = """
+    ON CONFLICT (tanker_id) DO UPDATE SET
+        driver_id = EXCLUDED.driver_id,
+        current_status = EXCLUDED.current_status,
+        current_location_lat = EXCLUDED.current_location_lat,
+        current_location_lon = EXCLUDED.current_location_lon,
+        source_depot_id = EXCLUDED.source_depot_id,
+        destination_id = EXCLUDED.destination_id,
+        seal_status = EXCLUDED.seal_status,
+        oil_volume_liters = EXCLUDED.oil_volume_liters,
+        max_capacity_liters = EXCLUDED.max_capacity_liters,
+        last_update = CURRENT_TIMESTAMP,
+        trip_duration_hours = EXCLUDED.trip_duration_hours,
+        avg_speed_kmh = EXCLUDED.avg_speed_kmh,
+        status_changed_at = CASE
+            WHEN tankers.current_status IS DISTINCT FROM EXCLUDED.current_status
+            THEN CURRENT_TIMESTAMP
+            ELSE tankers.status_changed_at
+        END,
+        updated_at = CURRENT_TIMESTAMP
+"""
+# Row-list form for execute_values
+TANKER_UPSERT_SQL = f"INSERT INTO tankers ({TANKER_COLUMNS}) VALUES %s {TANKER_ON_CONFLICT_SQL}"
+TANKER_UPSERT_TEMPLATE = "(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)"
+
+# tanker_history columns written per tanker, in upsert-row order
+# (recorded_at is left to its CURRENT_TIMESTAMP default)
+HISTORY_COLUMNS = """
+    tanker_id, driver_id, status,
+    location_lat, location_lon,
+    source_depot_id, destination_id,
+    seal_status, oil_volume_liters, max_capacity_liters,
+    trip_duration_hours, avg_speed_kmh
+"""
+
+# Batches with more tankers than this write their history rows with COPY
+COPY_HISTORY_THRESHOLD = 50
+
+# Realistic Pakistani driver names pool (200+ names)
+DRIVER_NAMES = (
+    "Muhammad Usman", "Ali Khan", "Ahmed Raza", "Hassan Ali", "Salman Ahmed",
+    "Bilal Hussain", "Umar Farooq", "Faisal Mehmood", "Zain Ali", "Hamza Khan",
+    "Usman Ali", "Tariq Mehmood", "Bilal Hassan", "Omar Farooq", "Hassan Malik",
+    "Ahmed Khan", "Mohammad Ali", "Ibrahim Khan", "Yusuf Ali", "Zain Abbas",
+    "Hassan Raza", "Ali Raza", "Muhammad Ali", "Ahmed Ali", "Usman Raza",
+    "Bilal Khan", "Hamza Ali", "Zain Khan", "Omar Khan", "Faisal Khan",
+    "Salman Khan", "Tariq Ali", "Hassan Khan", "Ahmed Mehmood", "Usman Mehmood",
+    "Bilal Mehmood", "Ali Mehmood", "Muhammad Raza", "Ahmed Hassan", "Usman Hassan",
+    "Hassan Hassan", "Bilal Raza", "Ali Hassan", "Omar Raza", "Faisal Raza",
+    "Salman Raza", "Tariq Raza", "Zain Raza", "Hamza Raza", "Ibrahim Raza",
+    "Yusuf Raza", "Muhammad Hassan", "Ahmed Abbas", "Usman Abbas", "Hassan Abbas",
+    "Bilal Abbas", "Ali Abbas", "Omar Abbas", "Faisal Abbas", "Salman Abbas",
+    "Tariq Abbas", "Zain Abbas", "Hamza Abbas", "Ibrahim Abbas", "Yusuf Abbas",
+    "Muhammad Abbas", "Ahmed Sheikh", "Usman Sheikh", "Hassan Sheikh", "Bilal Sheikh",
+    "Ali Sheikh", "Omar Sheikh", "Faisal Sheikh", "Salman Sheikh", "Tariq Sheikh",
+    "Zain Sheikh", "Hamza Sheikh", "Ibrahim Sheikh", "Yusuf Sheikh", "Muhammad Sheikh",
+    "Ahmed Malik", "Usman Malik", "Hassan Malik", "Bilal Malik", "Ali Malik",
+    "Omar Malik", "Faisal Malik", "Salman Malik", "Tariq Malik", "Zain Malik",
+    "Hamza Malik", "Ibrahim Malik", "Yusuf Malik", "Muhammad Malik", "Ahmed Noor",
+    "Usman Noor", "Hassan Noor", "Bilal Noor", "Ali Noor", "Omar Noor",
+    "Faisal Noor", "Salman Noor", "Tariq Noor", "Zain Noor", "Hamza Noor",
+    "Ibrahim Noor", "Yusuf Noor", "Muhammad Noor", "Ahmed Butt", "Usman Butt",
+    "Hassan Butt", "Bilal Butt", "Ali Butt", "Omar Butt", "Faisal Butt",
+    "Salman Butt", "Tariq Butt", "Zain Butt", "Hamza Butt", "Ibrahim Butt",
+    "Yusuf Butt", "Muhammad Butt", "Ahmed Qureshi", "Usman Qureshi", "Hassan Qureshi",
+    "Bilal Qureshi", "Ali Qureshi", "Omar Qureshi", "Faisal Qureshi", "Salman Qureshi",
+    "Tariq Qureshi", "Zain Qureshi", "Hamza Qureshi", "Ibrahim Qureshi", "Yusuf Qureshi",
+    "Muhammad Qureshi", "Ahmed Hashmi", "Usman Hashmi", "Hassan Hashmi", "Bilal Hashmi",
+    "Ali Hashmi", "Omar Hashmi", "Faisal Hashmi", "Salman Hashmi", "Tariq Hashmi",
+    "Zain Hashmi", "Hamza Hashmi", "Ibrahim Hashmi", "Yusuf Hashmi", "Muhammad Hashmi",
+    "Ahmed Javed", "Usman Javed", "Hassan Javed", "Bilal Javed", "Ali Javed",
+    "Omar Javed", "Faisal Javed", "Salman Javed", "Tariq Javed", "Zain Javed",
+    "Hamza Javed", "Ibrahim Javed", "Yusuf Javed", "Muhammad Javed", "Ahmed Aslam",
+    "Usman Aslam", "Hassan Aslam", "Bilal Aslam", "Ali Aslam", "Omar Aslam",
+    "Faisal Aslam", "Salman Aslam", "Tariq Aslam", "Zain Aslam", "Hamza Aslam",
+    "Ibrahim Aslam", "Yusuf Aslam", "Muhammad Aslam", "Ahmed Nadeem", "Usman Nadeem",
+    "Hassan Nadeem", "Bilal Nadeem", "Ali Nadeem", "Omar Nadeem", "Faisal Nadeem",
+    "Salman Nadeem", "Tariq Nadeem", "Zain Nadeem", "Hamza Nadeem", "Ibrahim Nadeem",
+    "Yusuf Nadeem", "Muhammad Nadeem", "Ahmed Saeed", "Usman Saeed", "Hassan Saeed",
+    "Bilal Saeed", "Ali Saeed", "Omar Saeed", "Faisal Saeed", "Salman Saeed",
+    "Tariq Saeed", "Zain Saeed", "Hamza Saeed", "Ibrahim Saeed", "Yusuf Saeed",
+    "Muhammad Saeed", "Ahmed Waseem", "Usman Waseem", "Hassan Waseem", "Bilal Waseem",
+    "Ali Waseem", "Omar Waseem", "Faisal Waseem", "Salman Waseem", "Tariq Waseem",
+    "Zain Waseem", "Hamza Waseem", "Ibrahim Waseem", "Yusuf Waseem", "Muhammad Waseem",
+    "Ahmed Naeem", "Usman Naeem", "Hassan Naeem", "Bilal Naeem", "Ali Naeem",
+    "Omar Naeem", "Faisal Naeem", "Salman Naeem", "Tariq Naeem", "Zain Naeem",
+    "Hamza Naeem", "Ibrahim Naeem", "Yusuf Naeem", "Muhammad Naeem", "Ahmed Shafiq",
+    "Usman Shafiq", "Hassan Shafiq", "Bilal Shafiq", "Ali Shafiq", "Omar Shafiq",
+    "Faisal Shafiq", "Salman Shafiq", "Tariq Shafiq", "Zain Shafiq", "Hamza Shafiq",
+    "Ibrahim Shafiq", "Yusuf Shafiq", "Muhammad Shafiq", "Ahmed Tariq", "Usman Tariq",
+    "Hassan Tariq", "Bilal Tariq", "Ali Tariq", "Omar Tariq", "Faisal Tariq",
+    "Salman Tariq", "Tariq Tariq", "Zain Tariq", "Hamza Tariq", "Ibrahim Tariq",
+    "Yusuf Tariq", "Muhammad Tariq"
+)
+
+DEPOTS = (
+    ("Islamabad", 33.6844, 73.0479),
+    ("Lahore", 31.5204, 74.3587),
+    ("Karachi", 24.8607, 67.0011),
+    ("Rawalpindi", 33.5651, 73.0169),
+    ("Faisalabad", 31.4504, 73.1350),
+    ("Multan", 30.1575, 71.5249),
+    ("Hyderabad", 25.3960, 68.3578),
+    ("Peshawar", 34.0151, 71.5249),
+    ("Quetta", 30.1798, 66.9750),
+    ("Sukkur", 27.7022, 68.8581)
+)
+
+# Realistic Pakistani oil, fuel, and energy companies
+DESTINATIONS = (
+    ("Pakistan State Oil (PSO)", 24.8607, 67.0011),  # Karachi
+    ("Shell Pakistan Limited (SPL)", 31.5204, 74.3587),  # Lahore
+    ("Total Parco Pakistan (TPP)", 33.6844, 73.0479),  # Islamabad
+    ("National Refinery Limited", 24.8607, 67.0011),  # Karachi
+    ("Attock Refinery Limited (ARL)", 33.5651, 73.0169),  # Rawalpindi
+    ("Hub Power Services Limited (HPSL)", 24.8607, 67.0011),  # Karachi
+    ("Cnergyico PK Limited", 24.8607, 67.0011),  # Karachi
+    ("Byco Petroleum Pakistan Limited", 24.8607, 67.0011),  # Karachi
+    ("Engro Energy", 24.8607, 67.0011),  # Karachi
+    ("Pak-Arab Refinery Limited (PARCO)", 31.4504, 73.1350)  # Faisalabad
+)
+
+STATUSES = ("At Source", "In Transit", "Reached Destination", "Delayed", "Loading", "Unloading")
+
+# (lat, lon) rows aligned with DEPOTS / DESTINATIONS, for generate_batch()
+DEPOT_COORDS = np.array([depot[1:] for depot in DEPOTS])
+DESTINATION_COORDS = np.array([destination[1:] for destination in DESTINATIONS])
+DEPOT_COORDS.flags.writeable = False
+DESTINATION_COORDS.flags.writeable = False
+
+# Status transition rules (deterministic), shared read-only by all generators
+STATUS_TRANSITIONS = MappingProxyType({
+    "At Source": {"next": "Loading", "duration_minutes": 15},
+    "Loading": {"next": "In Transit", "duration_minutes": 30},
+    "In Transit": {"next": "Reached Destination", "duration_minutes": 300},  # 5 hours
+    "Reached Destination": {"next": "Unloading", "duration_minutes": 45},
+    "Unloading": {"next": "At Source", "duration_minutes": 60},
+    "Delayed": {"next": "In Transit", "duration_minutes": 60},  # After delay, continue transit
+})
+
+# Most tankers one status-transition pass moves; any further due tankers are
+# picked up by the next pass
+STATUS_TRANSITION_BATCH_SIZE = 500
+
+# Applies due status transitions (oldest first) and records them in tanker_history.
+# Parameters: $1 from-status, $2 next-status and $3 duration-minutes arrays
+# (the rules).
+# Location moves to the destination / depot on arrival / return, the seal is
+# closed while moving, and speed and trip duration are kept (or drawn at
+# random if unset) only while In Transit.
+STATUS_TRANSITION_SQL = f"""
+    WITH rules AS (
+        -- Each rule's cutoff is computed once from the server clock, so the
+        -- due check below is a plain range on (current_status, status_changed_at)
+        SELECT from_status, next_status,
+               CURRENT_TIMESTAMP - make_interval(mins => duration_minutes) AS due_before
+        FROM unnest($1::text[], $2::text[], $3::int[])
+            AS r(from_status, next_status, duration_minutes)
+    ),
+    due AS (
+        SELECT t.tanker_id, t.current_status AS old_status, r.next_status,
+               d.location_lat AS dest_lat, d.location_lon AS dest_lon,
+               dep.location_lat AS depot_lat, dep.location_lon AS depot_lon
+        FROM tankers t
+        JOIN rules r ON r.from_status = t.current_status
+        LEFT JOIN destinations d ON t.destination_id = d.destination_id
+        LEFT JOIN depots dep ON t.source_depot_id = dep.depot_id
+        WHERE t.status_changed_at <= r.due_before
+        ORDER BY t.status_changed_at
+        LIMIT {STATUS_TRANSITION_BATCH_SIZE}
+        -- Rows another worker is already transitioning are skipped, so
+        -- concurrent generators split the due tankers between them
+        FOR UPDATE OF t SKIP LOCKED
+    ),
+    moved AS (
+        UPDATE tankers t SET
+            current_status = due.next_status,
+            current_location_lat = CASE due.next_status
+                WHEN 'Reached Destination' THEN COALESCE(due.dest_lat, t.current_location_lat)
+                WHEN 'At Source' THEN COALESCE(due.depot_lat, t.current_location_lat)
+                ELSE t.current_location_lat
+            END,
+            current_location_lon = CASE due.next_status
+                WHEN 'Reached Destination' THEN COALESCE(due.dest_lon, t.current_location_lon)
+                WHEN 'At Source' THEN COALESCE(due.depot_lon, t.current_location_lon)
+                ELSE t.current_location_lon
+            END,
+            seal_status = CASE
+                WHEN due.next_status IN ('In Transit', 'Reached Destination') THEN 'Sealed'
+                ELSE 'Open'
+            END,
+            trip_duration_hours = CASE
+                WHEN due.next_status <> 'In Transit' THEN 0
+                WHEN t.trip_duration_hours > 0 THEN t.trip_duration_hours
+                ELSE round((1.0 + random() * 5.0)::numeric, 2)
+            END,
+            avg_speed_kmh = CASE
+                WHEN due.next_status <> 'In Transit' THEN 0
+                WHEN t.avg_speed_kmh > 0 THEN t.avg_speed_kmh
+                ELSE round((60.0 + random() * 20.0)::numeric, 2)
+            END,
+            status_changed_at = CURRENT_TIMESTAMP,
+            last_update = CURRENT_TIMESTAMP,
+            updated_at = CURRENT_TIMESTAMP
+        FROM due
+        WHERE t.tanker_id = due.tanker_id
+        RETURNING t.*, due.old_status
+    ),
+    logged AS (
+        INSERT INTO tanker_history (
+            tanker_id, driver_id, status,
+            location_lat, location_lon,
+            source_depot_id, destination_id,
+            seal_status, oil_volume_liters, max_capacity_liters,
+            trip_duration_hours, avg_speed_kmh
+        )
+        SELECT
+            tanker_id, driver_id, current_status,
+            current_location_lat, current_location_lon,
+            source_depot_id, destination_id,
+            seal_status, oil_volume_liters, max_capacity_liters,
+            trip_duration_hours, avg_speed_kmh
+        FROM moved
+    )
+    SELECT tanker_id, old_status, current_status FROM moved
+"""
+
+# Highest numeric suffix among "XXX-<n>" tanker IDs, computed server-side
+MAX_TANKER_NUMBER_SQL = """
+    SELECT COALESCE(MAX(split_part(tanker_id, '-', 2)::bigint), 0)
+    FROM tankers
+    WHERE tanker_id ~ '^[^-]*-[0-9]+$'
+"""
+
+# driver/depot/destination IDs for a batch's uncached names, in one round-trip
+# (MIN(driver_id) since driver_name is not unique, as in warm_id_caches)
+FK_LOOKUP_SQL = """
+    SELECT 'driver' AS kind, driver_name AS name, MIN(driver_id) AS id
+    FROM drivers WHERE driver_name = ANY(%s) GROUP BY driver_name
+    UNION ALL
+    SELECT 'depot', depot_name, depot_id
+    FROM depots WHERE depot_name = ANY(%s)
+    UNION ALL
+    SELECT 'destination', destination_name, destination_id
+    FROM destinations WHERE destination_name = ANY(%s)
+"""
+
+# Statements the generator runs over and over, PREPAREd once per pooled
+# connection so later executions skip parse/plan
+_PREPARED_STATEMENTS = {
+    # Highest sequence number and a random sample of $1 tankers to update
+    'gen_cycle_targets': f"""
+        SELECT ({MAX_TANKER_NUMBER_SQL}),
+               ARRAY(SELECT tanker_id FROM tankers ORDER BY random() LIMIT $1)
+    """,
+    # Column-array form of the upsert (fixed signature whatever the batch
+    # size), recording each resulting row in tanker_history
+    'gen_upsert_tankers': f"""
+        WITH upserted AS (
+            INSERT INTO tankers ({TANKER_COLUMNS})
+            SELECT *, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP
+            FROM unnest(
+                $1::varchar[], $2::int[], $3::varchar[],
+                $4::numeric[], $5::numeric[],
+                $6::int[], $7::int[],
+                $8::varchar[], $9::numeric[], $10::numeric[],
+                $11::numeric[], $12::numeric[]
+            )
+            {TANKER_ON_CONFLICT_SQL}
+            RETURNING *
+        )
+        INSERT INTO tanker_history ({HISTORY_COLUMNS})
+        SELECT
+            tanker_id, driver_id, current_status,
+            current_location_lat, current_location_lon,
+            source_depot_id, destination_id,
+            seal_status, oil_volume_liters, max_capacity_liters,
+            trip_duration_hours, avg_speed_kmh
+        FROM upserted
+    """,
+    'gen_status_transitions': STATUS_TRANSITION_SQL,
+}
+
 
 class TankerDataGenerator:
     """Generates realistic tanker data and manages status transitions"""
@@ -24,121 +328,97 @@ class TankerDataGenerator:
         self.running = False
         self.thread = None
         self.status_transition_thread = None
+        # Set by stop(); workers wait on it between cycles so they exit
+        # immediately instead of finishing a sleep
+        self._stop_event = threading.Event()
+        # Connections are opened lazily on first use
+        self.pool = ConnectionPool(2, 8)
         
-        # Realistic Pakistani driver names pool (200+ names)
-        self.driver_names = [
-            "Muhammad Usman", "Ali Khan", "Ahmed Raza", "Hassan Ali", "Salman Ahmed",
-            "Bilal Hussain", "Umar Farooq", "Faisal Mehmood", "Zain Ali", "Hamza Khan",
-            "Usman Ali", "Tariq Mehmood", "Bilal Hassan", "Omar Farooq", "Hassan Malik",
-            "Ahmed Khan", "Mohammad Ali", "Ibrahim Khan", "Yusuf Ali", "Zain Abbas",
-            "Hassan Raza", "Ali Raza", "Muhammad Ali", "Ahmed Ali", "Usman Raza",
-            "Bilal Khan", "Hamza Ali", "Zain Khan", "Omar Khan", "Faisal Khan",
-            "Salman Khan", "Tariq Ali", "Hassan Khan", "Ahmed Mehmood", "Usman Mehmood",
-            "Bilal Mehmood", "Ali Mehmood", "Muhammad Raza", "Ahmed Hassan", "Usman Hassan",
-            "Hassan Hassan", "Bilal Raza", "Ali Hassan", "Omar Raza", "Faisal Raza",
-            "Salman Raza", "Tariq Raza", "Zain Raza", "Hamza Raza", "Ibrahim Raza",
-            "Yusuf Raza", "Muhammad Hassan", "Ahmed Abbas", "Usman Abbas", "Hassan Abbas",
-            "Bilal Abbas", "Ali Abbas", "Omar Abbas", "Faisal Abbas", "Salman Abbas",
-            "Tariq Abbas", "Zain Abbas", "Hamza Abbas", "Ibrahim Abbas", "Yusuf Abbas",
-            "Muhammad Abbas", "Ahmed Sheikh", "Usman Sheikh", "Hassan Sheikh", "Bilal Sheikh",
-            "Ali Sheikh", "Omar Sheikh", "Faisal Sheikh", "Salman Sheikh", "Tariq Sheikh",
-            "Zain Sheikh", "Hamza Sheikh", "Ibrahim Sheikh", "Yusuf Sheikh", "Muhammad Sheikh",
-            "Ahmed Malik", "Usman Malik", "Hassan Malik", "Bilal Malik", "Ali Malik",
-            "Omar Malik", "Faisal Malik", "Salman Malik", "Tariq Malik", "Zain Malik",
-            "Hamza Malik", "Ibrahim Malik", "Yusuf Malik", "Muhammad Malik", "Ahmed Noor",
-            "Usman Noor", "Hassan Noor", "Bilal Noor", "Ali Noor", "Omar Noor",
-            "Faisal Noor", "Salman Noor", "Tariq Noor", "Zain Noor", "Hamza Noor",
-            "Ibrahim Noor", "Yusuf Noor", "Muhammad Noor", "Ahmed Butt", "Usman Butt",
-            "Hassan Butt", "Bilal Butt", "Ali Butt", "Omar Butt", "Faisal Butt",
-            "Salman Butt", "Tariq Butt", "Zain Butt", "Hamza Butt", "Ibrahim Butt",
-            "Yusuf Butt", "Muhammad Butt", "Ahmed Qureshi", "Usman Qureshi", "Hassan Qureshi",
-            "Bilal Qureshi", "Ali Qureshi", "Omar Qureshi", "Faisal Qureshi", "Salman Qureshi",
-            "Tariq Qureshi", "Zain Qureshi", "Hamza Qureshi", "Ibrahim Qureshi", "Yusuf Qureshi",
-            "Muhammad Qureshi", "Ahmed Hashmi", "Usman Hashmi", "Hassan Hashmi", "Bilal Hashmi",
-            "Ali Hashmi", "Omar Hashmi", "Faisal Hashmi", "Salman Hashmi", "Tariq Hashmi",
-            "Zain Hashmi", "Hamza Hashmi", "Ibrahim Hashmi", "Yusuf Hashmi", "Muhammad Hashmi",
-            "Ahmed Javed", "Usman Javed", "Hassan Javed", "Bilal Javed", "Ali Javed",
-            "Omar Javed", "Faisal Javed", "Salman Javed", "Tariq Javed", "Zain Javed",
-            "Hamza Javed", "Ibrahim Javed", "Yusuf Javed", "Muhammad Javed", "Ahmed Aslam",
-            "Usman Aslam", "Hassan Aslam", "Bilal Aslam", "Ali Aslam", "Omar Aslam",
-            "Faisal Aslam", "Salman Aslam", "Tariq Aslam", "Zain Aslam", "Hamza Aslam",
-            "Ibrahim Aslam", "Yusuf Aslam", "Muhammad Aslam", "Ahmed Nadeem", "Usman Nadeem",
-            "Hassan Nadeem", "Bilal Nadeem", "Ali Nadeem", "Omar Nadeem", "Faisal Nadeem",
-            "Salman Nadeem", "Tariq Nadeem", "Zain Nadeem", "Hamza Nadeem", "Ibrahim Nadeem",
-            "Yusuf Nadeem", "Muhammad Nadeem", "Ahmed Saeed", "Usman Saeed", "Hassan Saeed",
-            "Bilal Saeed", "Ali Saeed", "Omar Saeed", "Faisal Saeed", "Salman Saeed",
-            "Tariq Saeed", "Zain Saeed", "Hamza Saeed", "Ibrahim Saeed", "Yusuf Saeed",
-            "Muhammad Saeed", "Ahmed Waseem", "Usman Waseem", "Hassan Waseem", "Bilal Waseem",
-            "Ali Waseem", "Omar Waseem", "Faisal Waseem", "Salman Waseem", "Tariq Waseem",
-            "Zain Waseem", "Hamza Waseem", "Ibrahim Waseem", "Yusuf Waseem", "Muhammad Waseem",
-            "Ahmed Naeem", "Usman Naeem", "Hassan Naeem", "Bilal Naeem", "Ali Naeem",
-            "Omar Naeem", "Faisal Naeem", "Salman Naeem", "Tariq Naeem", "Zain Naeem",
-            "Hamza Naeem", "Ibrahim Naeem", "Yusuf Naeem", "Muhammad Naeem", "Ahmed Shafiq",
-            "Usman Shafiq", "Hassan Shafiq", "Bilal Shafiq", "Ali Shafiq", "Omar Shafiq",
-            "Faisal Shafiq", "Salman Shafiq", "Tariq Shafiq", "Zain Shafiq", "Hamza Shafiq",
-            "Ibrahim Shafiq", "Yusuf Shafiq", "Muhammad Shafiq", "Ahmed Tariq", "Usman Tariq",
-            "Hassan Tariq", "Bilal Tariq", "Ali Tariq", "Omar Tariq", "Faisal Tariq",
-            "Salman Tariq", "Tariq Tariq", "Zain Tariq", "Hamza Tariq", "Ibrahim Tariq",
-            "Yusuf Tariq", "Muhammad Tariq"
-        ]
-        
-        self.depots = [
-            ("Islamabad", 33.6844, 73.0479),
-            ("Lahore", 31.5204, 74.3587),
-            ("Karachi", 24.8607, 67.0011),
-            ("Rawalpindi", 33.5651, 73.0169),
-            ("Faisalabad", 31.4504, 73.1350),
-            ("Multan", 30.1575, 71.5249),
-            ("Hyderabad", 25.3960, 68.3578),
-            ("Peshawar", 34.0151, 71.5249),
-            ("Quetta", 30.1798, 66.9750),
-            ("Sukkur", 27.7022, 68.8581)
-        ]
+        # name -> ID caches for the static driver/depot/destination pools,
+        # filled by warm_id_caches() with committed rows only
+        self._driver_ids = {}
+        self._depot_ids = {}
+        self._dest_ids = {}
         
-        # Realistic Pakistani oil, fuel, and energy companies
-        self.destinations = [
-            ("Pakistan State Oil (PSO)", 24.8607, 67.0011),  # Karachi
-            ("Shell Pakistan Limited (SPL)", 31.5204, 74.3587),  # Lahore
-            ("Total Parco Pakistan (TPP)", 33.6844, 73.0479),  # Islamabad
-            ("National Refinery Limited", 24.8607, 67.0011),  # Karachi
-            ("Attock Refinery Limited (ARL)", 33.5651, 73.0169),  # Rawalpindi
-            ("Hub Power Services Limited (HPSL)", 24.8607, 67.0011),  # Karachi
-            ("Cnergyico PK Limited", 24.8607, 67.0011),  # Karachi
-            ("Byco Petroleum Pakistan Limited", 24.8607, 67.0011),  # Karachi
-            ("Engro Energy", 24.8607, 67.0011),  # Karachi
-            ("Pak-Arab Refinery Limited (PARCO)", 31.4504, 73.1350)  # Faisalabad
-        ]
+        # Vectorized random draws for generate_batch()
+        self.rng = np.random.default_rng()
         
-        self.statuses = ["At Source", "In Transit", "Reached Destination", "Delayed", "Loading", "Unloading"]
+        # Static data pools (shared, immutable)
+        self.driver_names = DRIVER_NAMES
+        self.depots = DEPOTS
+        self.destinations = DESTINATIONS
+        self.statuses = STATUSES
         
         # Status transition rules (deterministic)
-        self.status_transitions = {
-            "At Source": {"next": "Loading", "duration_minutes": 15},
-            "Loading": {"next": "In Transit", "duration_minutes": 30},
-            "In Transit": {"next": "Reached Destination", "duration_minutes": 300},  # 5 hours
-            "Reached Destination": {"next": "Unloading", "duration_minutes": 45},
-            "Unloading": {"next": "At Source", "duration_minutes": 60},
-            "Delayed": {"next": "In Transit", "duration_minutes": 60},  # After delay, continue transit
-            "Reached Destination": {"next": "Unloading", "duration_minutes": 45}
-        }
+        self.status_transitions = STATUS_TRANSITIONS
     
-    def get_db_connection(self):
-        """Create and return a database connection"""
+    @contextmanager
+    def _conn(self):
+        """
+        Borrow a pooled database connection for the duration of a block.
+        The pool rolls back anything left uncommitted when it is returned.
+        """
+        conn = self.pool.getconn()
         try:
-            conn = psycopg2.connect(
-                dbname=DATABASE_NAME,
-                user=POSTGRES_USER,
-                password=POSTGRES_PASSWORD,
-                host=POSTGRES_HOST,
-                port=POSTGRES_PORT
-            )
-            return conn
+            yield conn
+        finally:
+            self.pool.putconn(conn)
+    
+    def warm_id_caches(self):
+        """
+        Create (where missing) every driver, depot and destination in the
+        static pools and cache their IDs, so steady-state writes need no
+        lookups. Runs in its own committed transaction so the cache never
+        holds IDs from a rolled-back cycle.
+        """
+        try:
+            with self._conn() as conn, conn.cursor() as cursor:
+                # DO UPDATE (rather than DO NOTHING) so RETURNING also yields existing rows
+                depot_ids = dict(execute_values(cursor, """
+                    INSERT INTO depots (depot_name, location_lat, location_lon) VALUES %s
+                    ON CONFLICT (depot_name) DO UPDATE SET depot_name = EXCLUDED.depot_name
+                    RETURNING depot_name, depot_id
+                """, self.depots, fetch=True))
+                dest_ids = dict(execute_values(cursor, """
+                    INSERT INTO destinations (destination_name, location_lat, location_lon) VALUES %s
+                    ON CONFLICT (destination_name) DO UPDATE SET destination_name = EXCLUDED.destination_name
+                    RETURNING destination_name, destination_id
+                """, self.destinations, fetch=True))
+                
+                # driver_name is not unique, so look drivers up first and only
+                # insert the missing ones
+                driver_names = list(dict.fromkeys(self.driver_names))
+                cursor.execute("""
+                    SELECT driver_name, MIN(driver_id)
+                    FROM drivers
+                    WHERE driver_name = ANY(%s)
+                    GROUP BY driver_name
+                """, (driver_names,))
+                driver_ids = dict(cursor.fetchall())
+                missing = [(name,) for name in driver_names if name not in driver_ids]
+                if missing:
+                    driver_ids.update(execute_values(cursor, """
+                        INSERT INTO drivers (driver_name) VALUES %s
+                        RETURNING driver_name, driver_id
+                    """, missing, page_size=1000, fetch=True))
+                
+                conn.commit()
         except Exception as e:
-            logger.error(f"Database connection error: {e}")
-            return None
+            logger.error(f"Error warming driver/depot/destination ID caches: {e}")
+            return False
+        
+        self._driver_ids = driver_ids
+        self._depot_ids = depot_ids
+        self._dest_ids = dest_ids
+        logger.info(f"Cached IDs for {len(driver_ids)} drivers, {len(depot_ids)} depots, {len(dest_ids)} destinations")
+        return True
     
     def get_or_create_driver(self, conn, driver_name):
         """Get or create a driver and return driver_id"""
+        driver_id = self._driver_ids.get(driver_name)
+        if driver_id is not None:
+            return driver_id
+        
         cursor = conn.cursor()
         try:
             cursor.execute("SELECT driver_id FROM drivers WHERE driver_name = %s", (driver_name,))
@@ -147,13 +427,16 @@ class TankerDataGenerator:
                 return result[0]
             else:
                 cursor.execute("INSERT INTO drivers (driver_name) VALUES (%s) RETURNING driver_id", (driver_name,))
-                conn.commit()
                 return cursor.fetchone()[0]
         finally:
             cursor.close()
     
     def get_or_create_depot(self, conn, depot_name, lat, lon):
         """Get or create a depot and return depot_id"""
+        depot_id = self._depot_ids.get(depot_name)
+        if depot_id is not None:
+            return depot_id
+        
         cursor = conn.cursor()
         try:
             cursor.execute("SELECT depot_id FROM depots WHERE depot_name = %s", (depot_name,))
@@ -165,13 +448,16 @@ class TankerDataGenerator:
                     "INSERT INTO depots (depot_name, location_lat, location_lon) VALUES (%s, %s, %s) RETURNING depot_id",
                     (depot_name, lat, lon)
                 )
-                conn.commit()
                 return cursor.fetchone()[0]
         finally:
             cursor.close()
     
     def get_or_create_destination(self, conn, dest_name, lat, lon):
         """Get or create a destination and return destination_id"""
+        dest_id = self._dest_ids.get(dest_name)
+        if dest_id is not None:
+            return dest_id
+        
         cursor = conn.cursor()
         try:
             cursor.execute("SELECT destination_id FROM destinations WHERE destination_name = %s", (dest_name,))
@@ -183,18 +469,45 @@ class TankerDataGenerator:
                     "INSERT INTO destinations (destination_name, location_lat, location_lon) VALUES (%s, %s, %s) RETURNING destination_id",
                     (dest_name, lat, lon)
                 )
-                conn.commit()
                 return cursor.fetchone()[0]
         finally:
             cursor.close()
     
+    def lookup_ids(self, conn, tanker_batch):
+        """
+        Resolve a batch's driver, depot and destination names to IDs:
+        from the caches where possible, otherwise all misses in one query.
+        Returns three name -> ID dicts; names not in the database yet are
+        absent and left for the caller to create.
+        """
+        batch_names = (
+            {tanker_data["driver_name"] for tanker_data in tanker_batch},
+            {tanker_data["source_depot"] for tanker_data in tanker_batch},
+            {tanker_data["destination"] for tanker_data in tanker_batch},
+        )
+        caches = (self._driver_ids, self._depot_ids, self._dest_ids)
+        resolved = tuple(
+            {name: cache[name] for name in names if name in cache}
+            for names, cache in zip(batch_names, caches)
+        )
+        missing = [
+            [name for name in names if name not in ids]
+            for names, ids in zip(batch_names, resolved)
+        ]
+        
+        if any(missing):
+            by_kind = dict(zip(("driver", "depot", "destination"), resolved))
+            with conn.cursor() as cursor:
+                cursor.execute(FK_LOOKUP_SQL, missing)
+                for kind, name, row_id in cursor.fetchall():
+                    by_kind[kind][name] = row_id
+        return resolved
+    
     def generate_realistic_tanker(self, tanker_id=None):
         """Generate a realistic tanker record"""
         if tanker_id is None:
             # Generate new tanker ID
-            existing_ids = self.get_existing_tanker_ids()
-            max_num = max([int(id.split('-')[1]) for id in existing_ids if '-' in id and id.split('-')[1].isdigit()], default=0)
-            tanker_id = f"TNK-{max_num + 1:03d}"
+            tanker_id = f"TNK-{self.next_tanker_number():03d}"
         
         # Select realistic combinations
         depot = random.choice(self.depots)
@@ -250,102 +563,144 @@ class TankerDataGenerator:
             "avg_speed_kmh": round(avg_speed, 2)
         }
     
-    def get_existing_tanker_ids(self):
-        """Get list of existing tanker IDs"""
-        conn = self.get_db_connection()
-        if not conn:
-            return []
+    def generate_batch(self, n, tanker_ids=None):
+        """
+        Generate n realistic tanker records at once, the same way as
+        generate_realistic_tanker but drawing each field for the whole batch
+        in one vectorized call. New TNK-### IDs are allocated if tanker_ids
+        is not given.
+        """
+        if tanker_ids is None:
+            first_number = self.next_tanker_number()
+            tanker_ids = [f"TNK-{number:03d}" for number in range(first_number, first_number + n)]
+        rng = self.rng
+        
+        depot_idx = rng.integers(0, len(self.depots), n)
+        dest_idx = rng.integers(0, len(self.destinations), n)
+        driver_idx = rng.integers(0, len(self.driver_names), n)
+        
+        # 0 = At Source, 1 = In Transit, 2 = Loading
+        status_idx = rng.integers(0, 3, n)
+        at_source = status_idx == 0
+        in_transit = status_idx == 1
+        loading = status_idx == 2
+        statuses = np.array(["At Source", "In Transit", "Loading"])[status_idx]
+        
+        # Oil volume as a share of capacity: 0-20% at source, 50-80% loading,
+        # 80-95% in transit
+        max_capacity = rng.choice(np.array([18000, 20000, 22000, 25000]), n)
+        low = np.where(at_source, 0.0, np.where(loading, 0.5, 0.8))
+        high = np.where(at_source, 0.2, np.where(loading, 0.8, 0.95))
+        oil_volume = max_capacity * rng.uniform(low, high)
+        
+        # At the depot, or part-way to the destination while in transit
+        depot_coords = DEPOT_COORDS[depot_idx]
+        dest_coords = DESTINATION_COORDS[dest_idx]
+        progress = np.where(in_transit, rng.uniform(0.2, 0.8, n), 0.0)
+        coords = depot_coords + (dest_coords - depot_coords) * progress[:, None]
+        
+        trip_duration = np.where(in_transit, rng.uniform(1.0, 6.0, n), 0.0)
+        avg_speed = np.where(in_transit, rng.uniform(60, 80, n), 0.0)
+        
+        # Back to Python scalars only at the DB boundary
+        columns = zip(
+            tanker_ids, driver_idx.tolist(), depot_idx.tolist(), dest_idx.tolist(),
+            statuses.tolist(), np.round(coords, 6).tolist(),
+            np.round(oil_volume, 2).tolist(), max_capacity.tolist(),
+            np.round(trip_duration, 2).tolist(), np.round(avg_speed, 2).tolist()
+        )
+        batch = []
+        for tanker_id, driver, depot, dest, status, (lat, lon), volume, capacity, duration, speed in columns:
+            depot = self.depots[depot]
+            destination = self.destinations[dest]
+            batch.append({
+                "tanker_id": tanker_id,
+                "driver_name": self.driver_names[driver],
+                "current_status": status,
+                "current_location_lat": lat,
+                "current_location_lon": lon,
+                "source_depot": depot[0],
+                "depot_lat": depot[1],
+                "depot_lon": depot[2],
+                "destination": destination[0],
+                "dest_lat": destination[1],
+                "dest_lon": destination[2],
+                "seal_status": "Sealed" if status == "In Transit" else "Open",
+                "oil_volume_liters": volume,
+                "max_capacity_liters": capacity,
+                "trip_duration_hours": duration,
+                "avg_speed_kmh": speed
+            })
+        return batch
+    
+    def next_tanker_number(self, conn=None):
+        """Next free TNK-### sequence number (on the caller's connection if given)"""
+        if conn is None:
+            with self._conn() as conn:
+                return self.next_tanker_number(conn)
+        with conn.cursor() as cursor:
+            cursor.execute(MAX_TANKER_NUMBER_SQL)
+            return cursor.fetchone()[0] + 1
+    
+    def get_existing_tanker_ids(self, conn=None):
+        """Get list of existing tanker IDs (on the caller's connection if given)"""
+        if conn is not None:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT tanker_id FROM tankers")
+                return [row[0] for row in cursor.fetchall()]
+        
         try:
-            cursor = conn.cursor()
-            cursor.execute("SELECT tanker_id FROM tankers")
-            ids = [row[0] for row in cursor.fetchall()]
-            cursor.close()
-            return ids
+            with self._conn() as conn:
+                return self.get_existing_tanker_ids(conn)
         except Exception as e:
             logger.error(f"Error fetching tanker IDs: {e}")
             return []
-        finally:
-            conn.close()
     
     def insert_or_update_tanker(self, tanker_data):
         """Insert or update tanker in database"""
-        conn = self.get_db_connection()
-        if not conn:
+        try:
+            with self._conn() as conn:
+                self.insert_or_update_tankers(conn, [tanker_data])
+                conn.commit()
+            return True
+        except Exception as e:
+            logger.error(f"Error inserting/updating tanker: {e}")
             return False
+    
+    def insert_or_update_tankers(self, conn, tanker_batch):
+        """
+        Insert or update a batch of tankers in database, with their history rows.
+        Small batches go out as one statement; large ones as one upsert plus a
+        COPY of the history rows. Runs inside the caller's transaction: does
+        not commit, and raises on error.
+        """
+        if not tanker_batch:
+            return
         
-        try:
-            cursor = conn.cursor()
-            
-            # Get or create related entities
-            driver_id = self.get_or_create_driver(conn, tanker_data["driver_name"])
-            depot_id = self.get_or_create_depot(
-                conn, tanker_data["source_depot"], 
-                tanker_data["depot_lat"], tanker_data["depot_lon"]
-            )
-            dest_id = self.get_or_create_destination(
-                conn, tanker_data["destination"],
-                tanker_data["dest_lat"], tanker_data["dest_lon"]
-            )
-            
-            # Check if tanker exists
-            cursor.execute("SELECT current_status, status_changed_at FROM tankers WHERE LOWER(tanker_id) = LOWER(%s)", 
-                          (tanker_data["tanker_id"],))
-            existing = cursor.fetchone()
-            
-            current_time = datetime.now()
-            
-            if existing:
-                # Update existing tanker
-                old_status, status_changed_at = existing
-                new_status = tanker_data["current_status"]
-                
-                # Only update status_changed_at if status actually changed
-                status_changed_at_sql = "status_changed_at"
-                if old_status != new_status:
-                    status_changed_at_sql = "CURRENT_TIMESTAMP"
-                
-                cursor.execute(f"""
-                    UPDATE tankers SET
-                        driver_id = %s,
-                        current_status = %s,
-                        current_location_lat = %s,
-                        current_location_lon = %s,
-                        source_depot_id = %s,
-                        destination_id = %s,
-                        seal_status = %s,
-                        oil_volume_liters = %s,
-                        max_capacity_liters = %s,
-                        last_update = CURRENT_TIMESTAMP,
-                        trip_duration_hours = %s,
-                        avg_speed_kmh = %s,
-                        status_changed_at = {status_changed_at_sql},
-                        updated_at = CURRENT_TIMESTAMP
-                    WHERE LOWER(tanker_id) = LOWER(%s)
-                """, (
-                    driver_id, new_status,
-                    tanker_data["current_location_lat"],
-                    tanker_data["current_location_lon"],
-                    depot_id, dest_id,
-                    tanker_data["seal_status"],
-                    tanker_data["oil_volume_liters"],
-                    tanker_data["max_capacity_liters"],
-                    tanker_data["trip_duration_hours"],
-                    tanker_data["avg_speed_kmh"],
-                    tanker_data["tanker_id"]
-                ))
-            else:
-                # Insert new tanker
-                cursor.execute("""
-                    INSERT INTO tankers (
-                        tanker_id, driver_id, current_status,
-                        current_location_lat, current_location_lon,
-                        source_depot_id, destination_id,
-                        seal_status, oil_volume_liters, max_capacity_liters,
-                        last_update, trip_duration_hours, avg_speed_kmh,
-                        status_changed_at
-                    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP, %s, %s, CURRENT_TIMESTAMP)
-                """, (
-                    tanker_data["tanker_id"], driver_id, tanker_data["current_status"],
+        with conn.cursor() as cursor:
+            driver_ids, depot_ids, dest_ids = self.lookup_ids(conn, tanker_batch)
+            rows = []
+            for tanker_data in tanker_batch:
+                # Create related entities that don't exist yet
+                driver_id = driver_ids.get(tanker_data["driver_name"])
+                if driver_id is None:
+                    driver_id = driver_ids[tanker_data["driver_name"]] = self.get_or_create_driver(
+                        conn, tanker_data["driver_name"]
+                    )
+                depot_id = depot_ids.get(tanker_data["source_depot"])
+                if depot_id is None:
+                    depot_id = depot_ids[tanker_data["source_depot"]] = self.get_or_create_depot(
+                        conn, tanker_data["source_depot"],
+                        tanker_data["depot_lat"], tanker_data["depot_lon"]
+                    )
+                dest_id = dest_ids.get(tanker_data["destination"])
+                if dest_id is None:
+                    dest_id = dest_ids[tanker_data["destination"]] = self.get_or_create_destination(
+                        conn, tanker_data["destination"],
+                        tanker_data["dest_lat"], tanker_data["dest_lon"]
+                    )
+                rows.append((
+                    tanker_data["tanker_id"].upper(), driver_id, tanker_data["current_status"],
                     tanker_data["current_location_lat"], tanker_data["current_location_lon"],
                     depot_id, dest_id,
                     tanker_data["seal_status"], tanker_data["oil_volume_liters"],
@@ -353,187 +708,112 @@ class TankerDataGenerator:
                     tanker_data["trip_duration_hours"], tanker_data["avg_speed_kmh"]
                 ))
             
-            # Insert into history table
-            cursor.execute("""
-                INSERT INTO tanker_history (
-                    tanker_id, driver_id, status,
-                    location_lat, location_lon,
-                    source_depot_id, destination_id,
-                    seal_status, oil_volume_liters, max_capacity_liters,
-                    trip_duration_hours, avg_speed_kmh,
-                    recorded_at
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
-            """, (
-                tanker_data["tanker_id"], driver_id, tanker_data["current_status"],
-                tanker_data["current_location_lat"], tanker_data["current_location_lon"],
-                depot_id, dest_id,
-                tanker_data["seal_status"], tanker_data["oil_volume_liters"],
-                tanker_data["max_capacity_liters"],
-                tanker_data["trip_duration_hours"], tanker_data["avg_speed_kmh"]
-            ))
-            
-            conn.commit()
-            cursor.close()
-            return True
+            # Tanker IDs are stored upper-case (TNK-###), so the upsert can
+            # conflict on the primary key itself instead of LOWER(tanker_id).
+            # ON CONFLICT cannot touch the same row twice in one statement, so a
+            # tanker repeated within the batch is written with its last state
+            latest_rows = list({row[0]: row for row in rows}.values())
             
-        except Exception as e:
-            logger.error(f"Error inserting/updating tanker: {e}")
-            conn.rollback()
-            return False
-        finally:
-            conn.close()
+            if len(latest_rows) <= COPY_HISTORY_THRESHOLD:
+                # Upsert and record each resulting row in tanker_history, in a
+                # single prepared statement taking one array per column
+                execute_prepared(cursor, _PREPARED_STATEMENTS, 'gen_upsert_tankers',
+                                 tuple(list(column) for column in zip(*latest_rows)))
+            else:
+                # Large batch: stream history through COPY, which skips
+                # per-row INSERT parsing entirely
+                execute_values(cursor, TANKER_UPSERT_SQL, latest_rows,
+                               template=TANKER_UPSERT_TEMPLATE, page_size=500)
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(latest_rows)
+                buffer.seek(0)
+                cursor.copy_expert(
+                    f"COPY tanker_history ({HISTORY_COLUMNS}) FROM STDIN WITH (FORMAT csv)",
+                    buffer
+                )
     
     def process_status_transitions(self):
         """Process automatic status transitions based on time elapsed"""
-        conn = self.get_db_connection()
-        if not conn:
-            return
-        
+        rules = list(self.status_transitions.items())
         try:
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT tanker_id, current_status, status_changed_at
-                FROM tankers
-                WHERE current_status IN ('At Source', 'Loading', 'In Transit', 'Reached Destination', 'Unloading', 'Delayed')
-            """)
-            
-            tankers = cursor.fetchall()
-            current_time = datetime.now()
-            updates = []
-            
-            for tanker_id, status, status_changed_at in tankers:
-                if status_changed_at:
-                    elapsed_minutes = (current_time - status_changed_at).total_seconds() / 60
-                    
-                    if status in self.status_transitions:
-                        transition = self.status_transitions[status]
-                        if elapsed_minutes >= transition["duration_minutes"]:
-                            new_status = transition["next"]
-                            updates.append((tanker_id, new_status))
-            
-            # Apply updates
-            for tanker_id, new_status in updates:
-                # Get current tanker data to update location appropriately
-                cursor.execute("""
-                    SELECT t.*, d.location_lat as dest_lat, d.location_lon as dest_lon,
-                           dep.location_lat as depot_lat, dep.location_lon as depot_lon
-                    FROM tankers t
-                    LEFT JOIN destinations d ON t.destination_id = d.destination_id
-                    LEFT JOIN depots dep ON t.source_depot_id = dep.depot_id
-                    WHERE LOWER(t.tanker_id) = LOWER(%s)
-                """, (tanker_id,))
-                
-                tanker = cursor.fetchone()
-                if tanker:
-                    cols = [desc[0] for desc in cursor.description]
-                    tanker_dict = dict(zip(cols, tanker))
-                    
-                    # Update location based on new status
-                    if new_status == "Reached Destination":
-                        new_lat = tanker_dict.get("dest_lat") or tanker_dict.get("current_location_lat")
-                        new_lon = tanker_dict.get("dest_lon") or tanker_dict.get("current_location_lon")
-                    elif new_status == "At Source":
-                        new_lat = tanker_dict.get("depot_lat") or tanker_dict.get("current_location_lat")
-                        new_lon = tanker_dict.get("depot_lon") or tanker_dict.get("current_location_lon")
-                    else:
-                        new_lat = tanker_dict.get("current_location_lat")
-                        new_lon = tanker_dict.get("current_location_lon")
-                    
-                    # Update seal status
-                    new_seal = "Sealed" if new_status in ["In Transit", "Reached Destination"] else "Open"
-
-                    # Ensure speed/trip duration are populated when moving to In Transit
-                    current_speed = tanker_dict.get("avg_speed_kmh")
-                    current_duration = tanker_dict.get("trip_duration_hours")
-                    if new_status == "In Transit":
-                        if not current_speed or float(current_speed) <= 0:
-                            current_speed = round(random.uniform(60, 80), 2)
-                        if not current_duration or float(current_duration) <= 0:
-                            current_duration = round(random.uniform(1.0, 6.0), 2)
-                    else:
-                        # Non-transit statuses should not carry a moving speed
-                        current_speed = 0
-                        current_duration = 0
-                    
-                    cursor.execute("""
-                        UPDATE tankers SET
-                            current_status = %s,
-                            current_location_lat = %s,
-                            current_location_lon = %s,
-                            seal_status = %s,
-                            trip_duration_hours = %s,
-                            avg_speed_kmh = %s,
-                            status_changed_at = CURRENT_TIMESTAMP,
-                            last_update = CURRENT_TIMESTAMP,
-                            updated_at = CURRENT_TIMESTAMP
-                        WHERE LOWER(tanker_id) = LOWER(%s)
-                    """, (new_status, new_lat, new_lon, new_seal, current_duration, current_speed, tanker_id))
-                    
-                    # Add to history
-                    cursor.execute("""
-                        INSERT INTO tanker_history (
-                            tanker_id, driver_id, status,
-                            location_lat, location_lon,
-                            source_depot_id, destination_id,
-                            seal_status, oil_volume_liters, max_capacity_liters,
-                            trip_duration_hours, avg_speed_kmh
-                        )
-                        SELECT 
-                            tanker_id, driver_id, %s,
-                            %s, %s,
-                            source_depot_id, destination_id,
-                            %s, oil_volume_liters, max_capacity_liters,
-                            trip_duration_hours, avg_speed_kmh
-                        FROM tankers
-                        WHERE LOWER(tanker_id) = LOWER(%s)
-                    """, (new_status, new_lat, new_lon, new_seal, tanker_id))
-                    
-                    logger.info(f"Status transition: {tanker_id} {status} -> {new_status}")
-                    
-                    # Broadcast WebSocket update for status transition
-                    try:
-                        import sys
-                        if 'app' in sys.modules:
-                            from app import manager
-                            # Use pending message queue for background threads
-                            manager.add_pending_message({
-                                "type": "status_transition",
-                                "tanker_id": tanker_id,
-                                "old_status": status,
-                                "new_status": new_status,
-                                "timestamp": datetime.now().isoformat()
-                            })
-                    except Exception as e:
-                        logger.debug(f"Could not add WebSocket message: {e}")
-            
-            conn.commit()
-            cursor.close()
-            
+            with self._conn() as conn:
+                cursor = conn.cursor(cursor_factory=RealDictCursor)
+                cursor.execute(ASYNC_COMMIT_SQL)
+                # Every due transition is applied, and recorded in history, by
+                # one statement; the rules table is passed as three arrays
+                execute_prepared(cursor, _PREPARED_STATEMENTS, 'gen_status_transitions', (
+                    [status for status, _ in rules],
+                    [rule["next"] for _, rule in rules],
+                    [rule["duration_minutes"] for _, rule in rules]
+                ))
+                transitions = cursor.fetchall()
+                conn.commit()
+                cursor.close()
         except Exception as e:
             logger.error(f"Error processing status transitions: {e}")
-            conn.rollback()
-        finally:
-            conn.close()
+            return
+        
+        for transition in transitions:
+            tanker_id = transition["tanker_id"]
+            status = transition["old_status"]
+            new_status = transition["current_status"]
+            logger.info(f"Status transition: {tanker_id} {status} -> {new_status}")
+            
+            # Broadcast WebSocket update for status transition
+            try:
+                import sys
+                if 'app' in sys.modules:
+                    from app import manager
+                    # Use pending message queue for background threads
+                    manager.add_pending_message({
+                        "type": "status_transition",
+                        "tanker_id": tanker_id,
+                        "old_status": status,
+                        "new_status": new_status,
+                        "timestamp": datetime.now().isoformat()
+                    })
+            except Exception as e:
+                logger.debug(f"Could not add WebSocket message: {e}")
     
     def generate_data_cycle(self):
         """Single cycle of data generation"""
+        # Tables may not exist yet at start(); retried each cycle until it works
+        if not self._depot_ids:
+            self.warm_id_caches()
+        
         try:
-            # Generate 1-3 new or update existing tankers
-            num_operations = random.randint(1, 3)
-            existing_ids = self.get_existing_tanker_ids()
-            updated_tankers = []
-            
-            for _ in range(num_operations):
-                # 70% chance to update existing, 30% to create new
-                if existing_ids and random.random() < 0.7:
-                    tanker_id = random.choice(existing_ids)
-                    tanker_data = self.generate_realistic_tanker(tanker_id)
-                else:
-                    tanker_data = self.generate_realistic_tanker()
+            with self._conn() as conn:
+                # Generate 1-3 new or update existing tankers
+                num_operations = random.randint(1, 3)
                 
-                if self.insert_or_update_tanker(tanker_data):
-                    updated_tankers.append(tanker_data['tanker_id'])
-                    logger.info(f"Generated/Updated tanker: {tanker_data['tanker_id']}")
+                # Highest sequence number and a random sample of tankers to
+                # update, in one round-trip and without pulling every tanker ID
+                with conn.cursor() as cursor:
+                    cursor.execute(ASYNC_COMMIT_SQL)
+                    execute_prepared(cursor, _PREPARED_STATEMENTS, 'gen_cycle_targets', (num_operations,))
+                    max_number, sampled_ids = cursor.fetchone()
+                # New IDs are allocated locally so one cycle can create several
+                next_number = max_number + 1
+                tanker_ids = []
+                
+                for _ in range(num_operations):
+                    # 70% chance to update existing, 30% to create new
+                    if sampled_ids and random.random() < 0.7:
+                        tanker_ids.append(sampled_ids.pop())
+                    else:
+                        tanker_ids.append(f"TNK-{next_number:03d}")
+                        next_number += 1
+                tanker_batch = self.generate_batch(len(tanker_ids), tanker_ids)
+                
+                # The whole cycle is one transaction: a single commit (and WAL
+                # flush) instead of one per tanker and per new driver/depot/destination
+                self.insert_or_update_tankers(conn, tanker_batch)
+                conn.commit()
+            
+            updated_tankers = []
+            for tanker_data in tanker_batch:
+                updated_tankers.append(tanker_data['tanker_id'])
+                logger.info(f"Generated/Updated tanker: {tanker_data['tanker_id']}")
             
             # Broadcast WebSocket update if tankers were updated
             if updated_tankers:
@@ -551,7 +831,7 @@ class TankerDataGenerator:
                 except Exception as e:
                     # WebSocket not critical, log and continue
                     logger.debug(f"Could not add WebSocket message: {e}")
-            
+        
         except Exception as e:
             logger.error(f"Error in data generation cycle: {e}")
     
@@ -560,22 +840,20 @@ class TankerDataGenerator:
         while self.running:
             try:
                 self.process_status_transitions()
-                time.sleep(STATUS_TRANSITION_INTERVAL)
+                self._stop_event.wait(STATUS_TRANSITION_INTERVAL)
             except Exception as e:
                 logger.error(f"Error in status transition worker: {e}")
-                time.sleep(60)  # Wait a minute before retrying
+                self._stop_event.wait(60)  # Wait a minute before retrying
     
     def data_generation_worker(self):
         """Background worker for data generation"""
-        from config import DATA_GENERATION_INTERVAL
-        
         while self.running:
             try:
                 self.generate_data_cycle()
-                time.sleep(DATA_GENERATION_INTERVAL)
+                self._stop_event.wait(DATA_GENERATION_INTERVAL)
             except Exception as e:
                 logger.error(f"Error in data generation worker: {e}")
-                time.sleep(60)  # Wait a minute before retrying
+                self._stop_event.wait(60)  # Wait a minute before retrying
     
     def start(self):
         """Start the background services"""
@@ -584,6 +862,7 @@ class TankerDataGenerator:
             return
         
         self.running = True
+        self._stop_event.clear()
         self.thread = threading.Thread(target=self.data_generation_worker, daemon=True)
         self.status_transition_thread = threading.Thread(target=self.status_transition_worker, daemon=True)
         
@@ -594,10 +873,12 @@ class TankerDataGenerator:
     def stop(self):
         """Stop the background services"""
         self.running = False
+        self._stop_event.set()
         if self.thread:
             self.thread.join(timeout=5)
         if self.status_transition_thread:
             self.status_transition_thread.join(timeout=5)
+        self.pool.closeall()
         logger.info("Data generator stopped")
 
 
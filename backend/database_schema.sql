@@ -48,7 +48,7 @@ CREATE TABLE tankers (
     current_location_lat DECIMAL(10, 6),
     current_location_lon DECIMAL(10, 6),
     source_depot_id INTEGER REFERENCES depots(depot_id),
-    destination_id INTEGER REFERENCES destinations(destination_id),
+    destination_id INTEGER REFERENCES destinations(destination_id) ON DELETE SET NULL,
     seal_status VARCHAR(20) NOT NULL,
     oil_volume_liters DECIMAL(10, 2),
     max_capacity_liters DECIMAL(10, 2) NOT NULL,
@@ -69,7 +69,7 @@ CREATE TABLE tanker_history (
     location_lat DECIMAL(10, 6),
     location_lon DECIMAL(10, 6),
     source_depot_id INTEGER REFERENCES depots(depot_id),
-    destination_id INTEGER REFERENCES destinations(destination_id),
+    destination_id INTEGER REFERENCES destinations(destination_id) ON DELETE SET NULL,
     seal_status VARCHAR(20),
     oil_volume_liters DECIMAL(10, 2),
     max_capacity_liters DECIMAL(10, 2),
@@ -158,11 +158,17 @@ CREATE INDEX idx_tankers_depot ON tankers(source_depot_id);
 CREATE INDEX idx_tankers_destination ON tankers(destination_id);
 CREATE INDEX idx_tankers_last_update ON tankers(last_update);
 CREATE INDEX idx_tankers_status_changed ON tankers(status_changed_at);
+CREATE INDEX idx_tankers_status_since ON tankers(current_status, status_changed_at);
+CREATE INDEX idx_tankers_tanker_id_lower ON tankers(LOWER(tanker_id));
+
+-- Destinations table indexes (placeholder cleanup)
+CREATE INDEX idx_destinations_customer_name ON destinations(destination_name text_pattern_ops) WHERE destination_name LIKE 'Customer%';
 
 -- History table indexes (critical for time-series queries)
 CREATE INDEX idx_history_tanker_id ON tanker_history(tanker_id);
 CREATE INDEX idx_history_recorded_at ON tanker_history(recorded_at);
 CREATE INDEX idx_history_status ON tanker_history(status);
+CREATE INDEX idx_history_destination ON tanker_history(destination_id);
 CREATE INDEX idx_history_tanker_time ON tanker_history(tanker_id, recorded_at DESC);
 
 -- ML tables indexes
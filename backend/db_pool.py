@@ -0,0 +1,90 @@
+"""
+Database Connection Pool
+Pooled psycopg2 connections with per-connection prepared statements,
+shared by the chat, ML and data generator services
+"""
+import threading
+import psycopg2
+from psycopg2 import pool as psycopg2_pool
+from config import (
+    POSTGRES_USER, POSTGRES_PASSWORD, POSTGRES_HOST,
+    POSTGRES_PORT, DATABASE_NAME
+)
+
+# How long a checkout waits for a free connection before giving up
+POOL_WAIT_SECONDS = 5
+
+
+class PreparingConnection(psycopg2.extensions.connection):
+    """psycopg2 connection that remembers which statements it has PREPAREd"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared_statements = set()
+
+
+class ConnectionPool:
+    """
+    Lazily created ThreadedConnectionPool of PreparingConnections.
+    ThreadedConnectionPool raises PoolError as soon as it is exhausted, so
+    checkouts are gated by a semaphore of the same size and wait for a
+    connection to be returned instead.
+    """
+    
+    def __init__(self, minconn, maxconn):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self._pool = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(maxconn)
+    
+    def getconn(self, timeout=POOL_WAIT_SECONDS):
+        """
+        Check out a connection (return it with putconn). Waits up to timeout
+        seconds for a free one; raises PoolError if none is returned in time.
+        """
+        if not self._slots.acquire(timeout=timeout):
+            raise psycopg2_pool.PoolError("timed out waiting for a pooled connection")
+        try:
+            if self._pool is None:
+                with self._lock:
+                    if self._pool is None:
+                        self._pool = psycopg2_pool.ThreadedConnectionPool(
+                            self.minconn, self.maxconn,
+                            connection_factory=PreparingConnection,
+                            dbname=DATABASE_NAME,
+                            user=POSTGRES_USER,
+                            password=POSTGRES_PASSWORD,
+                            host=POSTGRES_HOST,
+                            port=POSTGRES_PORT
+                        )
+            return self._pool.getconn()
+        except BaseException:
+            self._slots.release()
+            raise
+    
+    def putconn(self, conn):
+        """Return a connection to the pool, discarding it if it was closed"""
+        self._pool.putconn(conn, close=bool(conn.closed))
+        self._slots.release()
+    
+    def closeall(self):
+        """Close every pooled connection; the next checkout opens a new pool"""
+        with self._lock:
+            if self._pool is not None:
+                self._pool.closeall()
+                self._pool = None
+                self._slots = threading.BoundedSemaphore(self.maxconn)
+
+
+def execute_prepared(cursor, statements, name, params=()):
+    """EXECUTE statements[name], preparing it on first use per connection"""
+    conn = cursor.connection
+    if name not in conn.prepared_statements:
+        cursor.execute(f"PREPARE {name} AS {statements[name]}")
+        conn.prepared_statements.add(name)
+    if params:
+        placeholders = ', '.join(['%s'] * len(params))
+        cursor.execute(f"EXECUTE {name} ({placeholders})", params)
+    else:
+        cursor.execute(f"EXECUTE {name}")
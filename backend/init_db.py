@@ -2,6 +2,7 @@
 Database Initialization Script
 Creates all required tables if they don't exist
 """
+import re
 import psycopg2
 from psycopg2 import errors
 from pathlib import Path
@@ -14,6 +15,130 @@ from config import (
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# DROP TABLE statements are removed from the schema for safety in production
+DROP_TABLE_RE = re.compile(r'DROP TABLE.*?CASCADE;', re.IGNORECASE | re.DOTALL)
+
+# Script tokens that matter when splitting statements: dollar-quote tags,
+# string literals, line comments and statement-ending semicolons
+SQL_TOKEN_RE = re.compile(r"\$[A-Za-z_0-9]*\$|'(?:[^']|'')*'|--[^\n]*|;")
+
+def split_sql_statements(script):
+    """
+    Split a SQL script into statements on top-level semicolons, dropping
+    line comments. Semicolons inside dollar-quoted bodies (plpgsql
+    functions), string literals and comments do not end a statement.
+    """
+    statements = []
+    parts = []
+    segment_start = 0
+    pos = 0
+    while True:
+        match = SQL_TOKEN_RE.search(script, pos)
+        if not match:
+            break
+        token = match.group()
+        pos = match.end()
+        if token.startswith('$'):
+            # Skip straight to the closing tag of the dollar-quoted body
+            end = script.find(token, pos)
+            pos = len(script) if end < 0 else end + len(token)
+        elif token.startswith('--'):
+            parts.append(script[segment_start:match.start()])
+            segment_start = pos
+        elif token == ';':
+            parts.append(script[segment_start:pos])
+            statements.append(''.join(parts).strip())
+            parts = []
+            segment_start = pos
+    parts.append(script[segment_start:])
+    statements.append(''.join(parts).strip())
+    
+    return [statement for statement in statements if statement and statement != ';']
+
+# Foreign keys that should null out (rather than block) when a destination is deleted
+SET_NULL_DESTINATION_FKS = (
+    ('tankers', 'tankers_destination_id_fkey'),
+    ('tanker_history', 'tanker_history_destination_id_fkey'),
+)
+
+def apply_migrations(cursor):
+    """
+    Bring an existing schema up to date with database_schema.sql.
+    Idempotent; the cursor's connection must be in autocommit mode.
+    """
+    # Destination FKs: ON DELETE SET NULL so deleting a destination is one statement
+    cursor.execute("""
+        SELECT conname
+        FROM pg_constraint
+        WHERE conname = ANY(%s) AND confdeltype <> 'n'
+    """, ([name for _, name in SET_NULL_DESTINATION_FKS],))
+    outdated = {row[0] for row in cursor.fetchall()}
+    
+    for table, constraint in SET_NULL_DESTINATION_FKS:
+        if constraint in outdated:
+            logger.info(f"Migrating {constraint} to ON DELETE SET NULL...")
+            cursor.execute(f"""
+                ALTER TABLE {table}
+                    DROP CONSTRAINT {constraint},
+                    ADD CONSTRAINT {constraint} FOREIGN KEY (destination_id)
+                        REFERENCES destinations(destination_id) ON DELETE SET NULL
+            """)
+    
+    # ON DELETE SET NULL has to find the referencing history rows by destination
+    cursor.execute("""
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_history_destination
+        ON tanker_history (destination_id)
+    """)
+    
+    # Index-backed lookup of placeholder "Customer ..." destinations
+    cursor.execute("""
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_destinations_customer_name
+        ON destinations (destination_name text_pattern_ops)
+        WHERE destination_name LIKE 'Customer%'
+    """)
+    
+    # Status-transition scan: due tankers by status, oldest change first
+    cursor.execute("""
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_tankers_status_since
+        ON tankers (current_status, status_changed_at)
+    """)
+    
+    # Case-insensitive tanker lookups (WHERE LOWER(tanker_id) = LOWER(%s))
+    cursor.execute("""
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_tankers_tanker_id_lower
+        ON tankers (LOWER(tanker_id))
+    """)
+
+def execute_statements(cursor, statements):
+    """
+    Execute statements one by one, skipping objects that already exist.
+    Returns the number of statements that ran successfully.
+    """
+    executed_count = 0
+    for statement in statements:
+        try:
+            cursor.execute(statement)
+            executed_count += 1
+        except (errors.DuplicateTable, errors.DuplicateObject) as e:
+            logger.debug(f"Already exists (skipping): {str(e)[:50]}")
+        except psycopg2.Error as e:
+            error_msg = str(e).lower()
+            error_code = getattr(e, 'pgcode', None)
+            # PostgreSQL error codes for "already exists" scenarios
+            # 42P07 = duplicate_table, 42710 = duplicate_object
+            if error_code in ('42P07', '42710') or 'already exists' in error_msg or 'duplicate' in error_msg:
+                logger.debug(f"Already exists (skipping): {str(e)[:50]}")
+            else:
+                logger.warning(f"Error executing statement: {str(e)[:150]}")
+                logger.debug(f"Statement was: {statement[:100]}...")
+        except Exception as e:
+            error_msg = str(e).lower()
+            # Ignore "already exists" errors
+            if 'already exists' not in error_msg and 'duplicate' not in error_msg:
+                logger.warning(f"Unexpected error executing statement: {str(e)[:150]}")
+                logger.debug(f"Statement was: {statement[:100]}...")
+    return executed_count
+
 def init_database():
     """Initialize database with schema"""
     try:
@@ -41,6 +166,10 @@ def init_database():
         
         if len(existing_tables) >= 4:
             logger.info("✅ Database tables already exist. Skipping initialization.")
+            try:
+                apply_migrations(cursor)
+            except psycopg2.Error as e:
+                logger.warning(f"Error applying schema migrations: {str(e)[:150]}")
             cursor.close()
             conn.close()
             return True
@@ -60,60 +189,30 @@ def init_database():
         logger.info("Executing schema...")
         
         # Remove DROP statements for safety in production
-        import re
-        safe_schema = schema_sql
-        # Replace DROP statements with comments
-        safe_schema = re.sub(r'DROP TABLE IF EXISTS.*?CASCADE;', '-- DROP statement skipped', safe_schema, flags=re.IGNORECASE | re.MULTILINE | re.DOTALL)
-        safe_schema = re.sub(r'DROP TABLE.*?CASCADE;', '-- DROP statement skipped', safe_schema, flags=re.IGNORECASE | re.MULTILINE | re.DOTALL)
-        
-        # Split SQL into individual statements and execute one by one
-        # This is necessary because psycopg2 execute() only handles one statement
-        statements = []
-        current_statement = []
-        
-        for line in safe_schema.split('\n'):
-            line = line.strip()
-            # Skip empty lines and comments
-            if not line or line.startswith('--'):
-                continue
-            
-            current_statement.append(line)
-            # If line ends with semicolon, it's the end of a statement
-            if line.endswith(';'):
-                statement = ' '.join(current_statement)
-                if statement and not statement.startswith('--'):
-                    statements.append(statement)
-                current_statement = []
-        
-        # Execute each statement
-        executed_count = 0
-        for statement in statements:
-            if not statement or 'DROP' in statement.upper():
-                continue
-            try:
-                cursor.execute(statement)
-                executed_count += 1
-            except (errors.DuplicateTable, errors.DuplicateObject) as e:
-                logger.debug(f"Already exists (skipping): {str(e)[:50]}")
-            except psycopg2.Error as e:
-                error_msg = str(e).lower()
-                error_code = getattr(e, 'pgcode', None)
-                # PostgreSQL error codes for "already exists" scenarios
-                # 42P07 = duplicate_table, 42710 = duplicate_object
-                if error_code in ('42P07', '42710') or 'already exists' in error_msg or 'duplicate' in error_msg:
-                    logger.debug(f"Already exists (skipping): {str(e)[:50]}")
-                else:
-                    logger.warning(f"Error executing statement: {str(e)[:150]}")
-                    logger.debug(f"Statement was: {statement[:100]}...")
-            except Exception as e:
-                error_msg = str(e).lower()
-                # Ignore "already exists" errors
-                if 'already exists' not in error_msg and 'duplicate' not in error_msg:
-                    logger.warning(f"Unexpected error executing statement: {str(e)[:150]}")
-                    logger.debug(f"Statement was: {statement[:100]}...")
+        safe_schema = DROP_TABLE_RE.sub('', schema_sql)
+        statements = [
+            statement for statement in split_sql_statements(safe_schema)
+            if 'DROP' not in statement.upper()
+        ]
+        
+        # Fresh database: run the whole script in one round-trip. A
+        # multi-statement query runs as a single transaction, so on any
+        # error (e.g. some objects already exist) nothing is applied and we
+        # fall back to executing statement by statement, skipping duplicates.
+        try:
+            cursor.execute('\n'.join(statements))
+            executed_count = len(statements)
+        except psycopg2.Error as e:
+            logger.info(f"Schema could not be applied in one pass ({str(e)[:80]}); applying statements one by one")
+            executed_count = execute_statements(cursor, statements)
         
         logger.info(f"✅ Executed {executed_count} statements successfully")
         
+        try:
+            apply_migrations(cursor)
+        except psycopg2.Error as e:
+            logger.warning(f"Error applying schema migrations: {str(e)[:150]}")
+        
         cursor.close()
         conn.close()
         
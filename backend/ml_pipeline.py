@@ -4,13 +4,15 @@ Learns patterns from tanker data and provides predictions
 """
 import psycopg2
 from psycopg2 import extras
+import io
 import numpy as np
 import pandas as pd
-import pickle
 import os
 import logging
 import json
+import threading
 from datetime import datetime, timedelta
+from cachetools import TTLCache
 
 # Configure logging first
 logging.basicConfig(level=logging.INFO)
@@ -18,19 +20,262 @@ logger = logging.getLogger(__name__)
 
 # Try to import sklearn, but make it optional
 try:
-    from sklearn.ensemble import RandomForestRegressor, RandomForestClassifier
+    from sklearn.ensemble import HistGradientBoostingRegressor, HistGradientBoostingClassifier
     from sklearn.model_selection import train_test_split
-    from sklearn.preprocessing import StandardScaler
+    from sklearn.compose import ColumnTransformer
+    from sklearn.preprocessing import StandardScaler, OneHotEncoder, FunctionTransformer
     from sklearn.metrics import mean_absolute_error, accuracy_score, classification_report
+    import joblib
     SKLEARN_AVAILABLE = True
 except ImportError:
     SKLEARN_AVAILABLE = False
     logger.warning("scikit-learn not installed. ML features will be disabled. Install with: pip install scikit-learn")
 
-from config import (
-    POSTGRES_USER, POSTGRES_PASSWORD, POSTGRES_HOST,
-    POSTGRES_PORT, DATABASE_NAME, ML_MODEL_DIR, ML_MIN_SAMPLES_FOR_TRAINING
-)
+# Optional: compile trained tree ensembles to native code for prediction
+try:
+    import treelite
+    import treelite.sklearn
+    import treelite_runtime
+    TREELITE_AVAILABLE = True
+except ImportError:
+    TREELITE_AVAILABLE = False
+
+# Optional: export trained models to ONNX and predict with ONNX Runtime
+# (used when Treelite is unavailable)
+try:
+    import onnxruntime
+    from skl2onnx import convert_sklearn
+    from skl2onnx.common.data_types import FloatTensorType
+    ONNX_AVAILABLE = True
+except ImportError:
+    ONNX_AVAILABLE = False
+
+from config import ML_MODEL_DIR, ML_MIN_SAMPLES_FOR_TRAINING
+from db_pool import ConnectionPool, execute_prepared
+from city_mapper import haversine_distance, haversine_distances, _haversine_kernel
+# Optional: JIT-compile the training feature pass (NumPy fallback otherwise),
+# with the same numba import / no-op njit fallback as the distance kernels
+from city_mapper import NUMBA_AVAILABLE, njit
+
+# Model input columns; categorical ones are one-hot encoded
+NUMERICAL_FEATURES = [
+    'location_lat', 'location_lon',
+    'oil_volume_liters', 'max_capacity_liters',
+    'trip_duration_hours', 'avg_speed_kmh',
+    'distance_to_dest', 'hour_of_day', 'day_of_week',
+    'time_since_last', 'status_duration'
+]
+CATEGORICAL_FEATURES = ['status', 'source_depot', 'destination']
+
+# Pool size; checkouts wait up to db_pool.POOL_WAIT_SECONDS for a free connection
+POOL_MAX_CONNECTIONS = 10
+
+# Current state of the tankers whose lower-cased IDs are given, in the same
+# columns as the training data (distance_to_dest is added client-side by
+# destination_distance)
+PREDICTION_FEATURES_SQL = """
+    SELECT 
+        t.tanker_id,
+        t.current_status as status,
+        t.current_location_lat as location_lat,
+        t.current_location_lon as location_lon,
+        t.oil_volume_liters, t.max_capacity_liters,
+        t.trip_duration_hours, t.avg_speed_kmh,
+        d.depot_name as source_depot,
+        dest.destination_name as destination,
+        dr.driver_name,
+        dest.location_lat as dest_lat,
+        dest.location_lon as dest_lon,
+        EXTRACT(HOUR FROM CURRENT_TIMESTAMP) as hour_of_day,
+        EXTRACT(DOW FROM CURRENT_TIMESTAMP) as day_of_week,
+        EXTRACT(EPOCH FROM CURRENT_TIMESTAMP - t.last_update) / 3600 as time_since_last,
+        EXTRACT(EPOCH FROM CURRENT_TIMESTAMP - t.status_changed_at) / 3600 as status_duration
+    FROM tankers t
+    LEFT JOIN depots d ON t.source_depot_id = d.depot_id
+    LEFT JOIN destinations dest ON t.destination_id = dest.destination_id
+    LEFT JOIN drivers dr ON t.driver_id = dr.driver_id
+    WHERE LOWER(t.tanker_id) = ANY($1::text[])
+"""
+
+# Size and freshness of the training window: training data is reloaded
+# only when these change
+TRAINING_WINDOW_STATS_SQL = """
+    SELECT COUNT(*), MAX(recorded_at)
+    FROM tanker_history
+    WHERE recorded_at >= CURRENT_TIMESTAMP - INTERVAL '30 days'
+"""
+
+# Statements run on every prediction, PREPAREd once per pooled connection
+# so later executions skip parse/plan
+_PREPARED_STATEMENTS = {
+    'ml_prediction_features': PREDICTION_FEATURES_SQL,
+}
+
+
+def dump_artifact(obj, path):
+    """
+    Save a model artifact uncompressed, so load_models() can memory-map its
+    arrays. Written to a temporary file and renamed into place: truncating a
+    file another process (or an older loaded model) has mapped would crash it.
+    """
+    tmp_path = f"{path}.tmp"
+    joblib.dump(obj, tmp_path, compress=0, protocol=5)
+    os.replace(tmp_path, path)
+
+
+# int64 view of NaT: "no previous record"
+NAT_NS = np.iinfo(np.int64).min
+
+
+@njit(cache=True, nogil=True)
+def _history_row_features_kernel(lat, lon, dest_lat, dest_lon, recorded_ns, prev_ns,
+                                 group_codes, n_groups,
+                                 out_dist, out_tsl, out_dur):
+    """Single pass of history_row_features over contiguous column arrays"""
+    group_totals = np.zeros(n_groups)
+    for i in range(lat.shape[0]):
+        # Missing destination: distance 0
+        if np.isnan(dest_lat[i]) or np.isnan(dest_lon[i]):
+            out_dist[i] = 0.0
+        else:
+            out_dist[i] = _haversine_kernel(lat[i], lon[i], dest_lat[i], dest_lon[i])
+        
+        if prev_ns[i] == NAT_NS:
+            out_tsl[i] = 0.0
+        else:
+            out_tsl[i] = (recorded_ns[i] - prev_ns[i]) / 3.6e12
+        
+        group_totals[group_codes[i]] += out_tsl[i]
+        out_dur[i] = group_totals[group_codes[i]]
+
+
+def grouped_cumsum(values, group_codes):
+    """
+    Running sum of values within each group, in row order (like
+    groupby(...).cumsum()), as one stable sort plus one cumsum
+    """
+    order = np.argsort(group_codes, kind='stable')
+    sorted_codes = group_codes[order]
+    totals = np.cumsum(values[order])
+    
+    # Subtract, from each row, the running total reached before its group starts
+    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+    before_start = np.r_[0.0, totals][starts]
+    group_sizes = np.diff(np.r_[starts, len(values)])
+    
+    result = np.empty(len(values))
+    result[order] = totals - np.repeat(before_start, group_sizes)
+    return result
+
+
+def history_row_features(df):
+    """
+    Per-row features of tanker_history rows ordered by (tanker_id, recorded_at):
+    great-circle distance to destination (km), hours since the tanker's
+    previous record, and running hours in the current status per
+    (tanker, status). The previous record is the preceding row of the same
+    tanker, or the prev_recorded_at column when the rows were filtered
+    server-side. Returns three float arrays.
+    """
+    n = len(df)
+    lat = df['location_lat'].to_numpy(dtype=np.float64)
+    lon = df['location_lon'].to_numpy(dtype=np.float64)
+    dest_lat = df['dest_lat'].to_numpy(dtype=np.float64)
+    dest_lon = df['dest_lon'].to_numpy(dtype=np.float64)
+    recorded_ns = df['recorded_at'].to_numpy(dtype='datetime64[ns]').view(np.int64)
+    tanker_codes, _ = pd.factorize(df['tanker_id'])
+    status_codes, status_values = pd.factorize(df['status'])
+    group_codes = tanker_codes * len(status_values) + status_codes
+    
+    if 'prev_recorded_at' in df:
+        prev_ns = pd.to_datetime(df['prev_recorded_at']).to_numpy(dtype='datetime64[ns]').view(np.int64)
+    else:
+        prev_ns = np.full(n, NAT_NS, dtype=np.int64)
+        prev_ns[1:] = np.where(tanker_codes[1:] == tanker_codes[:-1], recorded_ns[:-1], NAT_NS)
+    
+    if NUMBA_AVAILABLE:
+        distance = np.empty(n)
+        time_since_last = np.empty(n)
+        status_duration = np.empty(n)
+        _history_row_features_kernel(
+            lat, lon, dest_lat, dest_lon, recorded_ns, prev_ns,
+            group_codes, (tanker_codes.max() + 1) * len(status_values),
+            distance, time_since_last, status_duration
+        )
+        return distance, time_since_last, status_duration
+    
+    distance = destination_distances(lat, lon, dest_lat, dest_lon)
+    has_prev = prev_ns != NAT_NS
+    time_since_last = np.zeros(n)
+    time_since_last[has_prev] = (recorded_ns[has_prev] - prev_ns[has_prev]) / 3.6e12
+    return distance, time_since_last, grouped_cumsum(time_since_last, group_codes)
+
+
+def destination_distances(lat, lon, dest_lat, dest_lon):
+    """Great-circle km from each position to its destination (0 without a destination)"""
+    has_destination = ~(np.isnan(dest_lat) | np.isnan(dest_lon))
+    return np.where(has_destination, haversine_distances(lat, lon, dest_lat, dest_lon), 0.0)
+
+
+def destination_distance(row):
+    """Great-circle km from a prediction row's position to its destination (0 without one)"""
+    if row['dest_lat'] is None or row['dest_lon'] is None:
+        return 0.0
+    if row['location_lat'] is None or row['location_lon'] is None:
+        return np.nan
+    return haversine_distance(
+        float(row['location_lat']), float(row['location_lon']),
+        float(row['dest_lat']), float(row['dest_lon'])
+    )
+
+
+def build_feature_filler(encoder, scaler):
+    """
+    Generate the prediction feature fill specialized on a fitted encoder
+    and scaler: fill_features(x, row) writes one scaled feature row into
+    the float32 array x straight from a row dict, with every position,
+    category and scaler mean/scale baked in as a constant, so there is no
+    layout lookup, one-hot pass or separate scaling step per row.
+    Returns (fill_features, n_features).
+    """
+    n_numerical = len(NUMERICAL_FEATURES)
+    categories = encoder.named_transformers_['cat'].categories_
+    n_features = n_numerical + sum(len(column_categories) for column_categories in categories)
+    mean = scaler.mean_ if scaler.with_mean else np.zeros(n_features)
+    scale = scaler.scale_ if scaler.with_std else np.ones(n_features)
+    
+    # ColumnTransformer output order: numerical block, then one-hot block
+    lines = ["def fill_features(x, row):"]
+    for i, column in enumerate(NUMERICAL_FEATURES):
+        lines.append(f"    value = row[{column!r}]")
+        lines.append(f"    x[{i}] = NAN if value is None else (float(value) - {float(mean[i])!r}) / {float(scale[i])!r}")
+    
+    # Every one-hot column starts at its scaled 0; the row's category (if
+    # seen in training) is then set to its scaled 1
+    one_hot_zeros = (0.0 - mean[n_numerical:]) / scale[n_numerical:]
+    lines.append(f"    x[{n_numerical}:] = ONE_HOT_ZEROS")
+    position = n_numerical
+    for column, column_categories in zip(CATEGORICAL_FEATURES, categories):
+        lines.append(f"    value = row[{column!r}]")
+        keyword = "if"
+        for category in column_categories:
+            if category is None or (isinstance(category, float) and np.isnan(category)):
+                condition = "value is None"
+            else:
+                condition = f"value == {category!r}"
+            lines.append(f"    {keyword} {condition}:")
+            lines.append(f"        x[{position}] = {float((1.0 - mean[position]) / scale[position])!r}")
+            keyword = "elif"
+            position += 1
+    
+    namespace = {'NAN': float('nan'), 'ONE_HOT_ZEROS': one_hot_zeros.astype(np.float32)}
+    exec(compile("\n".join(lines), "<ml_pipeline:fill_features>", "exec"), namespace)
+    return namespace["fill_features"], n_features
+
+
+def numeric_block(frame):
+    """Numerical feature columns as float32 (missing values stay NaN: the models handle them)"""
+    return frame.astype(np.float32)
 
 
 class TankerMLPipeline:
@@ -48,30 +293,107 @@ class TankerMLPipeline:
         }
         
         self.scalers = {}
+        self.encoders = {}
+        self.predictors = {}  # Treelite-compiled models, when available
+        self.onnx_sessions = {}  # ONNX Runtime sessions, when Treelite is not available
         self.model_metadata = {}
+        
+        # Recent predictions keyed by (model_type, lower-cased tanker_id, models_version),
+        # so dashboards polling the same tankers skip the DB query and the
+        # model. _models_version is bumped whenever a model is (re)loaded or
+        # retrained, which retires every cached prediction at once.
+        # TTLCache is not thread-safe; _prediction_cache_lock guards it.
+        self._prediction_cache = TTLCache(maxsize=2048, ttl=30)
+        self._prediction_cache_lock = threading.Lock()
+        self._models_version = 0
+        
+        # Generated feature fill per fitted encoder/scaler, and per-thread
+        # reusable float32 feature buffers for the predict path
+        self._feature_fillers = {}
+        self._scratch = threading.local()
+        
+        # Metadata of models trained by train_all_models on this thread,
+        # saved together once all of them are trained
+        self._pending_metadata = threading.local()
+        
+        # Last loaded training data per (status_filter, target_range):
+        # (row_count, max_recorded_at, df) of the window it was loaded from
+        self._training_cache = {}
+        
+        # Connection pool (connections are opened lazily on first use)
+        self._pool = ConnectionPool(1, POOL_MAX_CONNECTIONS)
     
     def get_db_connection(self):
-        """Create and return a database connection"""
+        """
+        Check out a pooled database connection (return it with _release_connection).
+        Waits up to db_pool.POOL_WAIT_SECONDS for a free connection; returns None on timeout.
+        """
         try:
-            conn = psycopg2.connect(
-                dbname=DATABASE_NAME,
-                user=POSTGRES_USER,
-                password=POSTGRES_PASSWORD,
-                host=POSTGRES_HOST,
-                port=POSTGRES_PORT
-            )
-            return conn
+            return self._pool.getconn()
         except Exception as e:
             logger.error(f"Database connection error: {e}")
             return None
     
-    def load_training_data(self, min_samples=ML_MIN_SAMPLES_FOR_TRAINING):
-        """Load historical data for training"""
+    def _release_connection(self, conn):
+        """Return a connection to the pool, discarding it if it was closed"""
+        try:
+            self._pool.putconn(conn)
+        except Exception as e:
+            logger.debug(f"Error releasing connection: {e}")
+    
+    def count_history_since(self, since):
+        """
+        Number of tanker_history rows recorded after since, and the latest
+        recorded_at among them (None if there are none).
+        Returns None if the database is unavailable.
+        """
         conn = self.get_db_connection()
         if not conn:
             return None
         
         try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT COUNT(*), MAX(recorded_at)
+                    FROM tanker_history
+                    WHERE recorded_at > %s
+                """, (since,))
+                return cursor.fetchone()
+        except Exception as e:
+            logger.error(f"Error counting new history rows: {e}")
+            return None
+        finally:
+            self._release_connection(conn)
+    
+    def load_training_data(self, min_samples=ML_MIN_SAMPLES_FOR_TRAINING,
+                           status_filter=None, target_range=None):
+        """
+        Load historical data for training. status_filter and target_range
+        (exclusive (low, high) bounds on trip_duration_hours) restrict the
+        rows server-side. The previous result is reused while the 30-day
+        window's row count and latest recorded_at are unchanged.
+        """
+        conn = self.get_db_connection()
+        if not conn:
+            return None
+        
+        try:
+            # Cheap size/freshness check before the full pull
+            with conn.cursor() as cursor:
+                cursor.execute(TRAINING_WINDOW_STATS_SQL)
+                row_count, max_recorded_at = cursor.fetchone()
+            
+            if row_count < min_samples:
+                logger.debug(f"Not enough training samples yet: {row_count} < {min_samples}. Need {min_samples - row_count} more samples.")
+                return None
+            
+            cache_key = (status_filter, target_range)
+            cached = self._training_cache.get(cache_key)
+            if cached is not None and cached[:2] == (row_count, max_recorded_at) and len(cached[2]) >= min_samples:
+                logger.debug(f"Training data unchanged ({row_count} rows); reusing the loaded data")
+                # Trainers add columns to the frame they get: keep the cached one intact
+                return cached[2].copy()
+            
             # Load historical data with features
             query = """
                 SELECT 
@@ -87,14 +409,12 @@ class TankerMLPipeline:
                     d.depot_name as source_depot,
                     dest.destination_name as destination,
                     dr.driver_name,
-                    -- Calculate distance (simplified)
-                    ABS(h.location_lat - COALESCE(dest.location_lat, h.location_lat)) +
-                    ABS(h.location_lon - COALESCE(dest.location_lon, h.location_lon)) as distance_to_dest,
+                    dest.location_lat as dest_lat,
+                    dest.location_lon as dest_lon,
                     -- Time features
                     EXTRACT(HOUR FROM h.recorded_at) as hour_of_day,
-                    EXTRACT(DOW FROM h.recorded_at) as day_of_week,
-                    -- Lag features (previous status duration)
-                    LAG(h.recorded_at) OVER (PARTITION BY h.tanker_id ORDER BY h.recorded_at) as prev_recorded_at
+                    EXTRACT(DOW FROM h.recorded_at) as day_of_week
+                    {lag_columns}
                 FROM tanker_history h
                 LEFT JOIN depots d ON h.source_depot_id = d.depot_id
                 LEFT JOIN destinations dest ON h.destination_id = dest.destination_id
@@ -103,63 +423,85 @@ class TankerMLPipeline:
                 ORDER BY h.tanker_id, h.recorded_at
             """
             
-            df = pd.read_sql_query(query, conn)
+            filters = []
+            params = []
+            if status_filter is not None:
+                filters.append("status = %s")
+                params.append(status_filter)
+            if target_range is not None:
+                filters.append("trip_duration_hours > %s AND trip_duration_hours < %s")
+                params.extend(target_range)
+            
+            if filters:
+                # Lag features still need each row's previous record in any
+                # status, so take it before filtering
+                query = query.format(lag_columns=(
+                    ", LAG(h.recorded_at) OVER (PARTITION BY h.tanker_id ORDER BY h.recorded_at)"
+                    " as prev_recorded_at"
+                ))
+                query = f"""
+                    SELECT * FROM ({query}) history
+                    WHERE {' AND '.join(filters)}
+                    ORDER BY tanker_id, recorded_at
+                """
+            else:
+                query = query.format(lag_columns="")
+            
+            # Stream the rows through COPY as CSV and parse them in bulk,
+            # instead of decoding them one by one through a cursor
+            buffer = io.StringIO()
+            with conn.cursor() as cursor:
+                if params:
+                    # COPY takes no bind parameters: inline them safely
+                    query = cursor.mogrify(query, params).decode(psycopg2.extensions.encodings[conn.encoding])
+                cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)", buffer)
+            buffer.seek(0)
+            df = pd.read_csv(buffer)
             
             if len(df) < min_samples:
                 logger.debug(f"Not enough training samples yet: {len(df)} < {min_samples}. Need {min_samples - len(df)} more samples.")
                 return None
             
-            # Calculate time differences
-            df['prev_recorded_at'] = pd.to_datetime(df['prev_recorded_at'])
+            # Distance and lag features, on rows already ordered by tanker and time
             df['recorded_at'] = pd.to_datetime(df['recorded_at'])
-            df['time_since_last'] = (df['recorded_at'] - df['prev_recorded_at']).dt.total_seconds() / 3600
-            df['time_since_last'] = df['time_since_last'].fillna(0)
-            
-            # Calculate status duration (for transitions)
-            df['status_duration'] = df.groupby(['tanker_id', 'status'])['time_since_last'].cumsum()
+            (
+                df['distance_to_dest'], df['time_since_last'], df['status_duration']
+            ) = history_row_features(df)
             
-            conn.close()
-            return df
+            self._training_cache[cache_key] = (row_count, max_recorded_at, df)
+            return df.copy()
             
         except Exception as e:
             logger.error(f"Error loading training data: {e}")
-            if conn:
-                conn.close()
             return None
+        finally:
+            self._release_connection(conn)
     
-    def prepare_features(self, df):
-        """Prepare features for ML models"""
-        # Encode categorical variables
-        status_encoded = pd.get_dummies(df['status'], prefix='status')
-        depot_encoded = pd.get_dummies(df['source_depot'], prefix='depot', dummy_na=True)
-        dest_encoded = pd.get_dummies(df['destination'], prefix='dest', dummy_na=True)
-        
-        # Numerical features
-        numerical_features = [
-            'location_lat', 'location_lon',
-            'oil_volume_liters', 'max_capacity_liters',
-            'trip_duration_hours', 'avg_speed_kmh',
-            'distance_to_dest', 'hour_of_day', 'day_of_week',
-            'time_since_last', 'status_duration'
-        ]
-        
-        # Combine all features
-        features = pd.concat([
-            df[numerical_features].fillna(0),
-            status_encoded,
-            depot_encoded,
-            dest_encoded
-        ], axis=1)
-        
-        return features
+    def build_feature_encoder(self):
+        """
+        Unfitted encoder from training/prediction rows to the model's (dense,
+        float32) feature matrix: numerical columns as-is, categorical columns
+        one-hot encoded as int8 (categories unseen in training are ignored)
+        """
+        return ColumnTransformer([
+            ('num', FunctionTransformer(numeric_block, feature_names_out='one-to-one'), NUMERICAL_FEATURES),
+            ('cat', OneHotEncoder(handle_unknown='ignore', sparse_output=False, dtype=np.int8), CATEGORICAL_FEATURES)
+        ], sparse_threshold=0)
     
-    def train_arrival_time_model(self, df):
+    def train_arrival_time_model(self, df=None):
         """Train model to predict arrival time"""
         if not SKLEARN_AVAILABLE:
             logger.error("Cannot train model: scikit-learn not installed")
             return False
+        
+        if df is None:
+            # Only in-transit rows with a usable target cross the wire
+            df = self.load_training_data(status_filter='In Transit', target_range=(0, 100))
+            if df is None:
+                return False
+        
         try:
-            # Filter for in-transit tankers
+            # Filter for in-transit tankers (a no-op when filtered server-side)
             transit_df = df[df['status'] == 'In Transit'].copy()
             
             if len(transit_df) < ML_MIN_SAMPLES_FOR_TRAINING:
@@ -170,31 +512,33 @@ class TankerMLPipeline:
             # For now, predict trip_duration_hours based on distance and speed
             transit_df['target'] = transit_df['trip_duration_hours']
             
-            # Prepare features
-            X = self.prepare_features(transit_df)
             y = transit_df['target'].fillna(0)
             
             # Remove rows with invalid targets
             valid_mask = (y > 0) & (y < 100)  # Reasonable bounds
-            X = X[valid_mask]
+            transit_df = transit_df[valid_mask]
             y = y[valid_mask]
             
-            if len(X) < ML_MIN_SAMPLES_FOR_TRAINING:
+            if len(transit_df) < ML_MIN_SAMPLES_FOR_TRAINING:
                 logger.warning("Not enough valid samples for arrival time model")
                 return False
             
+            # Prepare features
+            encoder = self.build_feature_encoder()
+            X = encoder.fit_transform(transit_df)
+            
             # Split data
             X_train, X_test, y_train, y_test = train_test_split(
                 X, y, test_size=0.2, random_state=42
             )
             
             # Scale features
-            scaler = StandardScaler()
+            scaler = StandardScaler(copy=False)
             X_train_scaled = scaler.fit_transform(X_train)
             X_test_scaled = scaler.transform(X_test)
             
             # Train model
-            model = RandomForestRegressor(n_estimators=50, max_depth=10, random_state=42)
+            model = HistGradientBoostingRegressor(max_iter=100, max_depth=8, early_stopping=True, random_state=42)
             model.fit(X_train_scaled, y_train)
             
             # Evaluate
@@ -206,17 +550,21 @@ class TankerMLPipeline:
             # Save model
             model_path = os.path.join(self.model_dir, "arrival_time_model.pkl")
             scaler_path = os.path.join(self.model_dir, "arrival_time_scaler.pkl")
+            encoder_path = os.path.join(self.model_dir, "arrival_time_encoder.pkl")
             
-            with open(model_path, 'wb') as f:
-                pickle.dump(model, f)
-            with open(scaler_path, 'wb') as f:
-                pickle.dump(scaler, f)
+            dump_artifact(model, model_path)
+            dump_artifact(scaler, scaler_path)
+            dump_artifact(encoder, encoder_path)
             
             self.models["arrival_time"] = model
             self.scalers["arrival_time"] = scaler
+            self.encoders["arrival_time"] = encoder
+            self.predictors["arrival_time"] = self.compile_model("arrival_time", model)
+            self.onnx_sessions["arrival_time"] = self.export_onnx("arrival_time", model)
+            self._models_version += 1
             
             # Save metadata to database
-            self.save_model_metadata("arrival_time", mae, list(X.columns))
+            self.save_model_metadata("arrival_time", mae, list(encoder.get_feature_names_out()))
             
             return True
             
@@ -234,10 +582,11 @@ class TankerMLPipeline:
             df['is_delayed'] = (df['status'] == 'Delayed').astype(int)
             
             # Prepare features
-            X = self.prepare_features(df)
+            encoder = self.build_feature_encoder()
+            X = encoder.fit_transform(df)
             y = df['is_delayed']
             
-            if len(X) < ML_MIN_SAMPLES_FOR_TRAINING:
+            if X.shape[0] < ML_MIN_SAMPLES_FOR_TRAINING:
                 logger.warning("Not enough samples for delay probability model")
                 return False
             
@@ -247,12 +596,12 @@ class TankerMLPipeline:
             )
             
             # Scale features
-            scaler = StandardScaler()
+            scaler = StandardScaler(copy=False)
             X_train_scaled = scaler.fit_transform(X_train)
             X_test_scaled = scaler.transform(X_test)
             
             # Train model
-            model = RandomForestClassifier(n_estimators=50, max_depth=10, random_state=42)
+            model = HistGradientBoostingClassifier(max_iter=100, max_depth=8, early_stopping='auto', random_state=42)
             model.fit(X_train_scaled, y_train)
             
             # Evaluate
@@ -264,17 +613,21 @@ class TankerMLPipeline:
             # Save model
             model_path = os.path.join(self.model_dir, "delay_probability_model.pkl")
             scaler_path = os.path.join(self.model_dir, "delay_probability_scaler.pkl")
+            encoder_path = os.path.join(self.model_dir, "delay_probability_encoder.pkl")
             
-            with open(model_path, 'wb') as f:
-                pickle.dump(model, f)
-            with open(scaler_path, 'wb') as f:
-                pickle.dump(scaler, f)
+            dump_artifact(model, model_path)
+            dump_artifact(scaler, scaler_path)
+            dump_artifact(encoder, encoder_path)
             
             self.models["delay_probability"] = model
             self.scalers["delay_probability"] = scaler
+            self.encoders["delay_probability"] = encoder
+            self.predictors["delay_probability"] = self.compile_model("delay_probability", model)
+            self.onnx_sessions["delay_probability"] = self.export_onnx("delay_probability", model)
+            self._models_version += 1
             
             # Save metadata
-            self.save_model_metadata("delay_probability", accuracy, list(X.columns))
+            self.save_model_metadata("delay_probability", accuracy, list(encoder.get_feature_names_out()))
             
             return True
             
@@ -298,7 +651,8 @@ class TankerMLPipeline:
                 return False
             
             # Prepare features
-            X = self.prepare_features(df)
+            encoder = self.build_feature_encoder()
+            X = encoder.fit_transform(df)
             y = df['next_status']
             
             # Split data
@@ -307,12 +661,14 @@ class TankerMLPipeline:
             )
             
             # Scale features
-            scaler = StandardScaler()
+            scaler = StandardScaler(copy=False)
             X_train_scaled = scaler.fit_transform(X_train)
             X_test_scaled = scaler.transform(X_test)
             
             # Train model
-            model = RandomForestClassifier(n_estimators=50, max_depth=10, random_state=42)
+            # Early stopping's stratified validation split needs every next
+            # status at least twice, so leave it to sklearn's size-based default
+            model = HistGradientBoostingClassifier(max_iter=100, max_depth=8, early_stopping='auto', random_state=42)
             model.fit(X_train_scaled, y_train)
             
             # Evaluate
@@ -324,17 +680,21 @@ class TankerMLPipeline:
             # Save model
             model_path = os.path.join(self.model_dir, "status_transition_model.pkl")
             scaler_path = os.path.join(self.model_dir, "status_transition_scaler.pkl")
+            encoder_path = os.path.join(self.model_dir, "status_transition_encoder.pkl")
             
-            with open(model_path, 'wb') as f:
-                pickle.dump(model, f)
-            with open(scaler_path, 'wb') as f:
-                pickle.dump(scaler, f)
+            dump_artifact(model, model_path)
+            dump_artifact(scaler, scaler_path)
+            dump_artifact(encoder, encoder_path)
             
             self.models["status_transition"] = model
             self.scalers["status_transition"] = scaler
+            self.encoders["status_transition"] = encoder
+            self.predictors["status_transition"] = self.compile_model("status_transition", model)
+            self.onnx_sessions["status_transition"] = self.export_onnx("status_transition", model)
+            self._models_version += 1
             
             # Save metadata
-            self.save_model_metadata("status_transition", accuracy, list(X.columns))
+            self.save_model_metadata("status_transition", accuracy, list(encoder.get_feature_names_out()))
             
             return True
             
@@ -342,8 +702,82 @@ class TankerMLPipeline:
             logger.error(f"Error training status transition model: {e}")
             return False
     
+    def compile_model(self, model_type, model):
+        """
+        Compile a trained tree ensemble to a native shared library with Treelite.
+        Returns its predictor, or None if Treelite is unavailable or
+        compilation fails (predictions then go through sklearn).
+        """
+        if not TREELITE_AVAILABLE:
+            return None
+        
+        libpath = os.path.join(self.model_dir, f"{model_type}_model.so")
+        try:
+            # Never leave a library from the previous model behind
+            if os.path.exists(libpath):
+                os.remove(libpath)
+            tl_model = treelite.sklearn.import_model(model)
+            tl_model.export_lib(toolchain='gcc', libpath=libpath, params={'parallel_comp': 4}, verbose=False)
+            return treelite_runtime.Predictor(libpath, verbose=False)
+        except Exception as e:
+            logger.warning(f"Could not compile {model_type} model with Treelite: {e}")
+            return None
+    
+    def export_onnx(self, model_type, model):
+        """
+        Export a trained model to ONNX and open an ONNX Runtime session on
+        it. Skipped when Treelite already compiled the model. Returns the
+        session, or None if ONNX is unavailable or the export fails.
+        """
+        if not ONNX_AVAILABLE or self.predictors.get(model_type) is not None:
+            return None
+        
+        onnx_path = os.path.join(self.model_dir, f"{model_type}_model.onnx")
+        try:
+            # Never leave an export of the previous model behind
+            if os.path.exists(onnx_path):
+                os.remove(onnx_path)
+            onnx_model = convert_sklearn(
+                model,
+                initial_types=[('X', FloatTensorType([None, model.n_features_in_]))],
+                options={'zipmap': False} if hasattr(model, 'predict_proba') else None
+            )
+            tmp_path = f"{onnx_path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(onnx_model.SerializeToString())
+            os.replace(tmp_path, onnx_path)
+            return self._onnx_session(onnx_path)
+        except Exception as e:
+            logger.warning(f"Could not export {model_type} model to ONNX: {e}")
+            return None
+    
+    def _onnx_session(self, onnx_path):
+        """ONNX Runtime session with full graph optimization, single-threaded per call"""
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        # Predictions are small batches from concurrent request threads
+        options.intra_op_num_threads = 1
+        return onnxruntime.InferenceSession(onnx_path, options, providers=['CPUExecutionProvider'])
+    
     def save_model_metadata(self, model_type, metric_value, feature_columns):
-        """Save model metadata to database"""
+        """Save model metadata to database (collected instead while train_all_models batches it)"""
+        entry = (model_type, metric_value, feature_columns)
+        pending = getattr(self._pending_metadata, 'entries', None)
+        if pending is not None:
+            pending.append(entry)
+            return
+        self.save_model_metadata_batch([entry])
+    
+    def save_model_metadata_batch(self, entries):
+        """
+        Save metadata for several newly trained models in one transaction:
+        one UPDATE deactivating the previous active models of those types
+        and one multi-row INSERT. entries are
+        (model_type, metric_value, feature_columns) tuples.
+        """
+        if not entries:
+            return
+        
         conn = self.get_db_connection()
         if not conn:
             return
@@ -351,32 +785,35 @@ class TankerMLPipeline:
         try:
             cursor = conn.cursor()
             
-            # Deactivate old models of this type
+            # Deactivate old models of these types (rows already inactive are left alone)
             cursor.execute("""
                 UPDATE ml_model_metadata 
                 SET is_active = FALSE 
-                WHERE model_type = %s
-            """, (model_type,))
+                WHERE model_type = ANY(%s) AND is_active
+            """, ([model_type for model_type, _, _ in entries],))
             
             # Insert new model metadata
-            model_version = datetime.now().strftime("%Y%m%d_%H%M%S")
-            model_path = os.path.join(self.model_dir, f"{model_type}_model.pkl")
-            
-            accuracy_metrics = {
-                "metric_value": float(metric_value),
-                "metric_type": "mae" if model_type == "arrival_time" else "accuracy"
-            }
+            training_date = datetime.now()
+            model_version = training_date.strftime("%Y%m%d_%H%M%S")
+            rows = []
+            for model_type, metric_value, feature_columns in entries:
+                model_path = os.path.join(self.model_dir, f"{model_type}_model.pkl")
+                accuracy_metrics = {
+                    "metric_value": float(metric_value),
+                    "metric_type": "mae" if model_type == "arrival_time" else "accuracy"
+                }
+                rows.append((
+                    model_type, model_version, training_date,
+                    json.dumps(accuracy_metrics),
+                    feature_columns, model_path, True
+                ))
             
-            cursor.execute("""
+            extras.execute_values(cursor, """
                 INSERT INTO ml_model_metadata (
                     model_type, model_version, training_date,
                     accuracy_metrics, feature_columns, model_path, is_active
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s)
-            """, (
-                model_type, model_version, datetime.now(),
-                json.dumps(accuracy_metrics),
-                feature_columns, model_path, True
-            ))
+                ) VALUES %s
+            """, rows, template="(%s, %s, %s, %s, %s, %s, %s)")
             
             conn.commit()
             cursor.close()
@@ -385,7 +822,7 @@ class TankerMLPipeline:
             logger.error(f"Error saving model metadata: {e}")
             conn.rollback()
         finally:
-            conn.close()
+            self._release_connection(conn)
     
     def load_models(self):
         """Load trained models from disk"""
@@ -393,152 +830,169 @@ class TankerMLPipeline:
             for model_type in self.models.keys():
                 model_path = os.path.join(self.model_dir, f"{model_type}_model.pkl")
                 scaler_path = os.path.join(self.model_dir, f"{model_type}_scaler.pkl")
+                encoder_path = os.path.join(self.model_dir, f"{model_type}_encoder.pkl")
                 
-                if os.path.exists(model_path) and os.path.exists(scaler_path):
-                    with open(model_path, 'rb') as f:
-                        self.models[model_type] = pickle.load(f)
-                    with open(scaler_path, 'rb') as f:
-                        self.scalers[model_type] = pickle.load(f)
+                if all(os.path.exists(path) for path in (model_path, scaler_path, encoder_path)):
+                    self.models[model_type] = joblib.load(model_path, mmap_mode='r')
+                    self.scalers[model_type] = joblib.load(scaler_path, mmap_mode='r')
+                    self.encoders[model_type] = joblib.load(encoder_path, mmap_mode='r')
+                    
+                    libpath = os.path.join(self.model_dir, f"{model_type}_model.so")
+                    if TREELITE_AVAILABLE and os.path.exists(libpath):
+                        self.predictors[model_type] = treelite_runtime.Predictor(libpath, verbose=False)
+                    else:
+                        self.predictors[model_type] = None
+                    
+                    onnx_path = os.path.join(self.model_dir, f"{model_type}_model.onnx")
+                    if self.predictors[model_type] is None and ONNX_AVAILABLE and os.path.exists(onnx_path):
+                        self.onnx_sessions[model_type] = self._onnx_session(onnx_path)
+                    else:
+                        self.onnx_sessions[model_type] = None
+                    self._models_version += 1
                     logger.info(f"Loaded {model_type} model")
         except Exception as e:
             logger.error(f"Error loading models: {e}")
     
-    def predict_arrival_time(self, tanker_id):
-        """Predict arrival time for a tanker"""
+    def _load_model_for_prediction(self, model_type):
+        """Lazy-load models if needed; True if model_type is ready to predict"""
         if not SKLEARN_AVAILABLE:
             logger.warning("ML predictions unavailable: scikit-learn not installed")
-            return None
+            return False
         
         # Lazy-load models only when needed
-        if self.models["arrival_time"] is None:
+        if self.models[model_type] is None:
             try:
                 self.load_models()
             except Exception as e:
                 logger.warning(f"Could not load ML models: {e}")
-                return None
+                return False
         
-        if self.models["arrival_time"] is None:
-            return None
+        return self.models[model_type] is not None
+    
+    def _predict_batch(self, model_type, tanker_ids, predict_values):
+        """
+        Predict for several tankers with one query and one model call,
+        serving cached predictions where possible. predict_values maps the
+        scaled feature matrix to one value per row. Returns
+        {tanker_id: value} for the tankers that exist.
+        """
+        results = {}
+        if not self._load_model_for_prediction(model_type):
+            return results
+        
+        version = self._models_version
+        missing = {}  # lower-cased ID -> requested spellings
+        with self._prediction_cache_lock:
+            for tanker_id in tanker_ids:
+                try:
+                    results[tanker_id] = self._prediction_cache[(model_type, tanker_id.lower(), version)]
+                except KeyError:
+                    missing.setdefault(tanker_id.lower(), []).append(tanker_id)
+        if not missing:
+            return results
         
         conn = self.get_db_connection()
         if not conn:
-            return None
+            return results
         
         try:
             # Get current tanker data
-            query = """
-                SELECT 
-                    t.tanker_id, t.current_status,
-                    t.current_location_lat, t.current_location_lon,
-                    t.oil_volume_liters, t.max_capacity_liters,
-                    t.trip_duration_hours, t.avg_speed_kmh,
-                    d.depot_name as source_depot,
-                    dest.destination_name as destination,
-                    dest.location_lat as dest_lat,
-                    dest.location_lon as dest_lon,
-                    dr.driver_name
-                FROM tankers t
-                LEFT JOIN depots d ON t.source_depot_id = d.depot_id
-                LEFT JOIN destinations dest ON t.destination_id = dest.destination_id
-                LEFT JOIN drivers dr ON t.driver_id = dr.driver_id
-                WHERE LOWER(t.tanker_id) = LOWER(%s)
-            """
-            
-            df = pd.read_sql_query(query, conn, params=(tanker_id,))
+            with conn.cursor(cursor_factory=extras.RealDictCursor) as cursor:
+                execute_prepared(cursor, _PREPARED_STATEMENTS, 'ml_prediction_features', (list(missing),))
+                rows = cursor.fetchall()
             
-            if len(df) == 0:
-                return None
-            
-            # Calculate features
-            row = df.iloc[0]
-            distance = abs(row['current_location_lat'] - row['dest_lat']) + \
-                      abs(row['current_location_lon'] - row['dest_lon'])
-            
-            # Prepare features (simplified - would need full feature engineering)
-            features = self.prepare_features(df)
-            
-            if len(features) == 0:
-                return None
+            if not rows:
+                return results
             
             # Predict
-            scaler = self.scalers["arrival_time"]
-            model = self.models["arrival_time"]
+            values = predict_values(self._scaled_features(model_type, rows)).tolist()
             
-            features_scaled = scaler.transform(features)
-            prediction = model.predict(features_scaled)[0]
-            
-            return max(0, prediction)  # Ensure non-negative
+            db_tanker_ids = [row['tanker_id'] for row in rows]
+            with self._prediction_cache_lock:
+                for db_tanker_id, value in zip(db_tanker_ids, values):
+                    self._prediction_cache[(model_type, db_tanker_id.lower(), version)] = value
+            for db_tanker_id, value in zip(db_tanker_ids, values):
+                for tanker_id in missing.get(db_tanker_id.lower(), ()):
+                    results[tanker_id] = value
+            return results
             
         except Exception as e:
-            logger.error(f"Error predicting arrival time: {e}")
-            return None
+            logger.error(f"Error predicting {model_type.replace('_', ' ')}: {e}")
+            return results
         finally:
-            conn.close()
+            self._release_connection(conn)
     
-    def predict_delay_probability(self, tanker_id):
-        """Predict delay probability for a tanker"""
-        if not SKLEARN_AVAILABLE:
-            logger.warning("ML predictions unavailable: scikit-learn not installed")
-            return None
-        
-        # Lazy-load models only when needed
-        if self.models["delay_probability"] is None:
-            try:
-                self.load_models()
-            except Exception as e:
-                logger.warning(f"Could not load ML models: {e}")
-                return None
+    def _feature_filler(self, model_type):
+        """(fill_features, n_features) for model_type's fitted encoder and scaler"""
+        encoder = self.encoders[model_type]
+        scaler = self.scalers[model_type]
+        cached = self._feature_fillers.get(model_type)
+        if cached is not None and cached[0] is encoder and cached[1] is scaler:
+            return cached[2]
         
-        if self.models["delay_probability"] is None:
-            return None
+        filler = build_feature_filler(encoder, scaler)
+        self._feature_fillers[model_type] = (encoder, scaler, filler)
+        self.model_metadata[model_type] = {"feature_columns": list(encoder.get_feature_names_out())}
+        return filler
+    
+    def _scaled_features(self, model_type, rows):
+        """
+        Scaled feature matrix for prediction rows, filled straight from the
+        row dicts into a reused float32 buffer by the generated fill (no
+        DataFrame, no encoder/scaler calls). Valid until the calling
+        thread's next prediction.
+        """
+        fill_features, n_features = self._feature_filler(model_type)
         
-        conn = self.get_db_connection()
-        if not conn:
-            return None
+        buffers = self._scratch.__dict__.setdefault('buffers', {})
+        buffer = buffers.get(model_type)
+        if buffer is None or buffer.shape[0] < len(rows) or buffer.shape[1] != n_features:
+            buffer = buffers[model_type] = np.empty((len(rows), n_features), dtype=np.float32)
+        features = buffer[:len(rows)]
         
-        try:
-            # Get current tanker data
-            query = """
-                SELECT 
-                    t.tanker_id, t.current_status,
-                    t.current_location_lat, t.current_location_lon,
-                    t.oil_volume_liters, t.max_capacity_liters,
-                    t.trip_duration_hours, t.avg_speed_kmh,
-                    d.depot_name as source_depot,
-                    dest.destination_name as destination,
-                    dr.driver_name
-                FROM tankers t
-                LEFT JOIN depots d ON t.source_depot_id = d.depot_id
-                LEFT JOIN destinations dest ON t.destination_id = dest.destination_id
-                LEFT JOIN drivers dr ON t.driver_id = dr.driver_id
-                WHERE LOWER(t.tanker_id) = LOWER(%s)
-            """
-            
-            df = pd.read_sql_query(query, conn, params=(tanker_id,))
-            
-            if len(df) == 0:
-                return None
-            
-            # Prepare features
-            features = self.prepare_features(df)
-            
-            if len(features) == 0:
-                return None
-            
-            # Predict
-            scaler = self.scalers["delay_probability"]
-            model = self.models["delay_probability"]
-            
-            features_scaled = scaler.transform(features)
-            probability = model.predict_proba(features_scaled)[0][1]  # Probability of delay
-            
-            return float(probability)
-            
-        except Exception as e:
-            logger.error(f"Error predicting delay probability: {e}")
-            return None
-        finally:
-            conn.close()
+        for x, row in zip(features, rows):
+            row['distance_to_dest'] = destination_distance(row)
+            fill_features(x, row)
+        return features
+    
+    def _arrival_time_values(self, features_scaled):
+        """Arrival time (hours) per feature row"""
+        predictor = self.predictors.get("arrival_time")
+        if predictor is not None:
+            hours = predictor.predict(treelite_runtime.DMatrix(features_scaled))
+        elif self.onnx_sessions.get("arrival_time") is not None:
+            hours = self.onnx_sessions["arrival_time"].run(None, {'X': features_scaled})[0]
+        else:
+            hours = self.models["arrival_time"].predict(features_scaled)
+        return np.maximum(np.ravel(hours), 0)  # Ensure non-negative
+    
+    def _delay_probability_values(self, features_scaled):
+        """Delay probability per feature row"""
+        predictor = self.predictors.get("delay_probability")
+        if predictor is not None:
+            # Binary classifier: Treelite outputs the positive-class probability
+            return np.ravel(predictor.predict(treelite_runtime.DMatrix(features_scaled)))
+        session = self.onnx_sessions.get("delay_probability")
+        if session is not None:
+            # Outputs: label, then per-class probabilities
+            return session.run(None, {'X': features_scaled})[1][:, 1]
+        return self.models["delay_probability"].predict_proba(features_scaled)[:, 1]  # Probability of delay
+    
+    def predict_arrival_time_batch(self, tanker_ids):
+        """Predict arrival time for several tankers: {tanker_id: hours}"""
+        return self._predict_batch("arrival_time", tanker_ids, self._arrival_time_values)
+    
+    def predict_delay_probability_batch(self, tanker_ids):
+        """Predict delay probability for several tankers: {tanker_id: probability}"""
+        return self._predict_batch("delay_probability", tanker_ids, self._delay_probability_values)
+    
+    def predict_arrival_time(self, tanker_id):
+        """Predict arrival time for a tanker"""
+        return self.predict_arrival_time_batch([tanker_id]).get(tanker_id)
+    
+    def predict_delay_probability(self, tanker_id):
+        """Predict delay probability for a tanker"""
+        return self.predict_delay_probability_batch([tanker_id]).get(tanker_id)
     
     def train_all_models(self):
         """Train all ML models"""
@@ -549,11 +1003,18 @@ class TankerMLPipeline:
             logger.info("No training data available yet. This is normal when the system first starts. Training will be retried automatically as data accumulates.")
             return False
         
-        results = {
-            "arrival_time": self.train_arrival_time_model(df),
-            "delay_probability": self.train_delay_probability_model(df),
-            "status_transition": self.train_status_transition_model(df)
-        }
+        # Collect the three models' metadata and save it in one batch
+        self._pending_metadata.entries = []
+        try:
+            results = {
+                "arrival_time": self.train_arrival_time_model(df),
+                "delay_probability": self.train_delay_probability_model(df),
+                "status_transition": self.train_status_transition_model(df)
+            }
+        finally:
+            entries = self._pending_metadata.entries
+            self._pending_metadata.entries = None
+        self.save_model_metadata_batch(entries)
         
         logger.info(f"Training complete. Results: {results}")
         return any(results.values())
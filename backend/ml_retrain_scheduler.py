@@ -1,16 +1,21 @@
 """
 Continuous ML Model Retraining Scheduler
 Runs periodic retraining of ML models as new data accumulates
+(skipped while too few new history rows have arrived)
 """
 import time
 import threading
 import logging
-from config import ML_RETRAIN_INTERVAL
+from datetime import datetime
+from config import ML_RETRAIN_INTERVAL, ML_MIN_SAMPLES_FOR_TRAINING
 from ml_pipeline import get_ml_pipeline
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# New tanker_history rows needed since the last retrain before retraining again
+MIN_NEW_ROWS_FOR_RETRAIN = max(1, ML_MIN_SAMPLES_FOR_TRAINING // 10)
+
 
 class MLRetrainScheduler:
     """Schedules periodic ML model retraining"""
@@ -19,27 +24,67 @@ class MLRetrainScheduler:
         self.running = False
         self.thread = None
         self.ml_pipeline = get_ml_pipeline()
+        # Latest recorded_at covered by the last successful retrain (None: never trained)
+        self.last_retrain_ts = None
+        # New rows seen by the last check
+        self.last_row_count = 0
+    
+    def has_enough_new_data(self):
+        """
+        Whether enough history rows arrived since the last retrain: one
+        COUNT over the recorded_at index instead of a full reload and fit.
+        Returns (retrain?, latest recorded_at among the new rows).
+        """
+        counted = self.ml_pipeline.count_history_since(self.last_retrain_ts or datetime.min)
+        if counted is None:
+            # Database unavailable: let train_all_models report it
+            return True, None
+        
+        self.last_row_count, latest = counted
+        if self.last_retrain_ts is None:
+            return True, latest
+        return self.last_row_count >= MIN_NEW_ROWS_FOR_RETRAIN, latest
     
     def retrain_worker(self):
         """Background worker for periodic retraining"""
         # Wait initially to allow data to accumulate
-        from config import DATA_GENERATION_INTERVAL, ML_MIN_SAMPLES_FOR_TRAINING
+        from config import DATA_GENERATION_INTERVAL
         initial_wait = max(120, DATA_GENERATION_INTERVAL * (ML_MIN_SAMPLES_FOR_TRAINING // 2))
         logger.info(f"ML retrain scheduler: Waiting {initial_wait} seconds before first training attempt...")
         time.sleep(initial_wait)
         
+        # Cycles are scheduled on a fixed monotonic grid, so the time spent
+        # retraining is not added on top of the interval
+        next_tick = time.monotonic()
+        
         while self.running:
             try:
-                logger.info("Starting scheduled ML model retraining...")
-                success = self.ml_pipeline.train_all_models()
-                if success:
-                    logger.info(f"✅ ML retraining complete. Next retrain in {ML_RETRAIN_INTERVAL} seconds")
+                enough_data, latest = self.has_enough_new_data()
+                if not enough_data:
+                    logger.debug(f"⏳ ML retraining skipped ({self.last_row_count} new history rows, "
+                                 f"need {MIN_NEW_ROWS_FOR_RETRAIN}). Will check again in next cycle.")
                 else:
-                    logger.debug("⏳ ML retraining skipped (not enough data yet). Will retry in next cycle.")
-                time.sleep(ML_RETRAIN_INTERVAL)
+                    logger.info("Starting scheduled ML model retraining...")
+                    success = self.ml_pipeline.train_all_models()
+                    if success:
+                        # Rows arriving after the check count towards the next retrain
+                        if latest is not None:
+                            self.last_retrain_ts = latest
+                        logger.info(f"✅ ML retraining complete. Next retrain in {ML_RETRAIN_INTERVAL} seconds")
+                    else:
+                        logger.debug("⏳ ML retraining skipped (not enough data yet). Will retry in next cycle.")
+                
+                # Next grid tick; a cycle that overran skips the missed ticks
+                # instead of starting the next one back-to-back
+                next_tick += ML_RETRAIN_INTERVAL
+                now = time.monotonic()
+                if next_tick < now:
+                    next_tick = now + (next_tick - now) % ML_RETRAIN_INTERVAL
+                time.sleep(next_tick - now)
             except Exception as e:
                 logger.error(f"Error in ML retraining: {e}")
                 time.sleep(3600)  # Wait an hour before retrying on error
+                next_tick = time.monotonic()
     
     def start(self):
         """Start the retraining scheduler"""
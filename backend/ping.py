@@ -6,6 +6,7 @@ Can be run as a separate worker service on Render or external monitoring service
 import os
 import time
 import requests
+from requests.adapters import HTTPAdapter
 import logging
 from datetime import datetime
 
@@ -15,6 +16,14 @@ logger = logging.getLogger(__name__)
 # Default Render deployment URL (can be overridden via APP_URL environment variable)
 DEFAULT_APP_URL = "https://tankerdatamanagementassistant.onrender.com"
 
+# One keep-alive session for all pings, so the TCP connection and TLS
+# session are reused while the server keeps them open. GET rather than
+# HEAD: the health check reads the JSON body.
+SESSION = requests.Session()
+SESSION.headers.update({'User-Agent': 'tdma-ping/1.0'})
+SESSION.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+SESSION.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+
 def ping_health_endpoint():
     """Ping the health endpoint"""
     # Get URL from environment variable or use default
@@ -26,7 +35,7 @@ def ping_health_endpoint():
     
     try:
         # Use timeout to prevent hanging
-        response = requests.get(health_url, timeout=10)
+        response = SESSION.get(health_url, timeout=10)
         
         if response.status_code == 200:
             try:
@@ -73,6 +82,10 @@ def main():
     consecutive_failures = 0
     max_failures_before_warning = 3
     
+    # Pings are scheduled on a fixed monotonic grid, so slow responses do
+    # not push later pings back (and wall-clock jumps do not matter)
+    next_tick = time.monotonic()
+    
     while True:
         try:
             success = ping_health_endpoint()
@@ -84,15 +97,21 @@ def main():
                 if consecutive_failures >= max_failures_before_warning:
                     logger.warning(f"⚠️ {consecutive_failures} consecutive failures. Service may be down.")
             
-            # Sleep before next ping (non-blocking, uses time.sleep)
-            time.sleep(ping_interval)
+            # Sleep until the next ping is due; a slow ping that overran
+            # skips the missed ticks instead of pinging back-to-back
+            next_tick += ping_interval
+            now = time.monotonic()
+            if next_tick < now:
+                next_tick = now + (next_tick - now) % ping_interval
+            time.sleep(next_tick - now)
             
         except KeyboardInterrupt:
             logger.info("🛑 Ping service stopped by user")
             break
         except Exception as e:
             logger.error(f"❌ Unexpected error in ping service: {e}")
-            # Continue running even after errors
+            # Continue running even after errors, a full interval from now
+            next_tick = time.monotonic() + ping_interval
             time.sleep(ping_interval)
 
 if __name__ == "__main__":